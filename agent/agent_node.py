@@ -1,6 +1,11 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
+import json
+import os
+import uuid
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
 from .prompts import system_prompt
+from services.embeddings import estimate_tokens
+from utils.deadline import DeadlineExceeded, expired, run_with_deadline
+from utils.metrics import LLM_METRICS_HANDLER
 from .tool_registry import (
     parse_idea,
     embed_idea,
@@ -8,13 +13,11 @@ from .tool_registry import (
     scholar_search,
     search_web,
     compare_similarity,
-    summarize_results
+    summarize_results,
+    search_deadline,
 )
 
-# Initialize the model
-llm = ChatOpenAI(model="gpt-4o", temperature=0.2)
-
-# Bind tools to the LLM
+# Tools the router can call
 tools = [
     parse_idea,
     embed_idea,
@@ -24,26 +27,121 @@ tools = [
     compare_similarity,
     summarize_results
 ]
-llm_with_tools = llm.bind_tools(tools)
+_router = None
+
+
+def get_router():
+    """
+    Returns the router model with the tools bound. It is created on first
+    use, so importing the agent doesn't load the OpenAI SDK.
+    """
+    global _router
+    if _router is None:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model="gpt-4o", temperature=0.2, stream_usage=True,
+                         callbacks=[LLM_METRICS_HANDLER])
+        _router = llm.bind_tools(tools)
+    return _router
+
+# Approximate token budget for the message history sent to the router on each
+# turn, not counting the system prompt. Older tool-call rounds beyond it are
+# dropped; 0 sends the full history.
+HISTORY_TOKEN_BUDGET = int(os.getenv("AGENT_HISTORY_TOKEN_BUDGET", "1500"))
+
+SYSTEM_MESSAGE = SystemMessage(content=system_prompt)
+
+# Sources each tool provides, for reporting the ones skipped at the deadline.
+TOOL_SOURCES = {
+    "embed_idea": "embedding",
+    "patent_search": "patents",
+    "scholar_search": "scholar",
+    "search_web": "web",
+}
+
+
+def finish_now(state) -> dict:
+    """
+    Once the search budget is spent, skips the router and calls the next
+    step towards a verdict directly, reporting the searches never run.
+    """
+    invoked = state.get("tool_invocation_count", {})
+    next_tool = "summarize_results" if invoked.get("compare_similarity") else "compare_similarity"
+    call = {"name": next_tool, "args": {"state": {}}, "id": f"call_deadline_{uuid.uuid4().hex[:12]}"}
+    skipped = [source for name, source in TOOL_SOURCES.items() if not invoked.get(name)]
+    return {
+        "messages": [AIMessage(content="", tool_calls=[call])],
+        "missing_sources": skipped,
+    }
+
+
+def estimate_message_tokens(message) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = estimate_tokens(content)
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(call["name"] + json.dumps(call.get("args"), default=str))
+    return tokens
+
+
+def select_history(state, budget=HISTORY_TOKEN_BUDGET) -> list:
+    """
+    Builds the router's prompt: the system prompt, the user's idea, and the
+    most recent tool-call rounds (an AI message with its tool results) that
+    fit in `budget` tokens. When older rounds are dropped, the system prompt
+    lists the tools already called so the router does not repeat them.
+    """
+    messages = state["messages"]
+    system = SYSTEM_MESSAGE
+    if messages and isinstance(messages[0], SystemMessage):
+        system, messages = messages[0], messages[1:]
+    if budget <= 0 or len(messages) <= 1:
+        return [system, *messages]
+
+    # Tool results must stay right after the AI message that requested them.
+    rounds = []
+    for message in messages[1:]:
+        if isinstance(message, ToolMessage) and rounds:
+            rounds[-1].append(message)
+        else:
+            rounds.append([message])
 
+    used = estimate_message_tokens(messages[0])
+    first_kept = len(rounds)
+    while first_kept > 0:
+        cost = sum(estimate_message_tokens(m) for m in rounds[first_kept - 1])
+        # The latest round is always kept.
+        if first_kept < len(rounds) and used + cost > budget:
+            break
+        used += cost
+        first_kept -= 1
 
-def agent_node(state):
+    if first_kept > 0:
+        called = [name for name, count in state.get("tool_invocation_count", {}).items() if count]
+        system = SystemMessage(content=(
+            f"{system.content}\n\nTools already called (do not call them again): "
+            f"{', '.join(called) or 'none'}."
+        ))
+    return [system, messages[0], *(m for r in rounds[first_kept:] for m in r)]
+
+
+async def agent_node(state):
     """
     Invokes the agent model to decide the next action and returns only the
     new message as an update.
     """
     # The graph framework will manage the message history. We just need to
-    # prepare the messages for the LLM.
-    messages = state["messages"]
+    # prepare the messages for the LLM, trimmed to the history budget.
+    messages_for_llm = select_history(state)
 
-    # Ensure the system prompt is the first message for the LLM.
-    if not isinstance(messages[0], SystemMessage):
-        messages_for_llm = [SystemMessage(content=system_prompt)] + messages
-    else:
-        messages_for_llm = messages
+    deadline = search_deadline(state)
+    if expired(deadline):
+        return finish_now(state)
 
-    # Invoke the model
-    response = llm_with_tools.invoke(messages_for_llm)
+    # Invoke the model without blocking the event loop
+    try:
+        response = await run_with_deadline(
+            get_router().ainvoke(messages_for_llm), deadline)
+    except DeadlineExceeded:
+        return finish_now(state)
 
     # Return only the new response. The graph will append this to the
     # 'messages' list in the state.
@@ -1,6 +1,7 @@
 from langgraph.graph import StateGraph, START, END
 from .agent_node import agent_node, tools
-from .state import AgentState
+from .state import AgentState, merge_missing_sources, merge_search_results
+from utils.metrics import observe_tool, timed_node
 from langchain_core.messages import ToolMessage
 import asyncio
 from typing import List
@@ -9,50 +10,80 @@ import inspect
 # Create a tool map for easy lookup
 tool_map = {tool.name: tool for tool in tools}
 
+# State keys that concurrent tools may all update; their values are merged
+# rather than overwritten.
+MERGED_KEYS = {
+    "search_results": merge_search_results,
+    "missing_sources": merge_missing_sources,
+}
+
 
 async def tool_executor(state: AgentState):
     """
     Executes tools and returns a dictionary of updates to the state, following
-    the correct LangGraph pattern.
+    the correct LangGraph pattern. Independent tool calls requested in the same
+    turn run concurrently; each tool returns only its own slice of the state,
+    and reducers on AgentState merge them.
     """
     tool_calls = state["messages"][-1].tool_calls
 
     # This dictionary will hold all the updates to be returned.
     updates = {}
 
-    # This list will hold the new tool messages to be added to the history.
-    tool_messages = []
+    # One ToolMessage per tool call, in the order the calls were requested.
+    tool_messages = [None] * len(tool_calls)
 
     # We need a copy of the invocation count to update it safely.
     invocation_count = state.get('tool_invocation_count', {}).copy()
 
-    for tool_call in tool_calls:
+    # Decide which calls run before launching any of them, so a tool
+    # requested twice in one turn is still only executed once.
+    runnable = []
+    for i, tool_call in enumerate(tool_calls):
         tool_name = tool_call["name"]
 
         if invocation_count.get(tool_name, 0) > 0:
             error_message = f"Error: Tool '{tool_name}' has already been called."
-            tool_messages.append(ToolMessage(
-                content=error_message, tool_call_id=tool_call["id"]))
+            tool_messages[i] = ToolMessage(
+                content=error_message, tool_call_id=tool_call["id"])
             continue
 
-        tool_to_call = tool_map[tool_name]
-
-        # The tool is invoked with the full state, as it's state-aware.
-        output_dict = await tool_to_call.ainvoke({"state": state})
-
+        invocation_count[tool_name] = invocation_count.get(tool_name, 0) + 1
+        runnable.append((i, tool_call))
+
+    async def run_tool(tool_name):
+        # The tools are invoked with the full state, as they're state-aware.
+        with observe_tool(tool_name):
+            return await tool_map[tool_name].ainvoke({"state": state})
+
+    # A failed tool fails the round, so cancel the tools still running
+    # instead of leaving them to finish in the background.
+    tasks = [asyncio.ensure_future(run_tool(tool_call["name"])) for _, tool_call in runnable]
+    try:
+        if tasks:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        outputs = [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    for (i, tool_call), output_dict in zip(runnable, outputs):
+        tool_name = tool_call["name"]
         if not isinstance(output_dict, dict):
             raise ValueError(f"Tool {tool_name} did not return a dictionary.")
 
-        # Collate the updates from the tool's output.
-        updates.update(output_dict)
-
-        tool_messages.append(
-            ToolMessage(
-                content=f"Successfully executed tool '{tool_name}'.",
-                tool_call_id=tool_call["id"],
-            )
+        # Collate the updates from the tool's output. Search results and
+        # missing sources from different tools are merged, not overwritten.
+        for key, value in output_dict.items():
+            if key in MERGED_KEYS:
+                updates[key] = MERGED_KEYS[key](updates.get(key), value)
+            else:
+                updates[key] = value
+
+        tool_messages[i] = ToolMessage(
+            content=f"Successfully executed tool '{tool_name}'.",
+            tool_call_id=tool_call["id"],
         )
-        invocation_count[tool_name] = invocation_count.get(tool_name, 0) + 1
 
     # The 'messages' update should only contain the *new* tool messages.
     updates["messages"] = tool_messages
@@ -96,8 +127,8 @@ def build_graph():
     Builds the execution graph for the agent.
     """
     graph = StateGraph(AgentState)
-    graph.add_node("agent", agent_node)
-    graph.add_node("tool_executor", tool_executor)
+    graph.add_node("agent", timed_node("agent", agent_node))
+    graph.add_node("tool_executor", timed_node("tool_executor", tool_executor))
 
     graph.set_entry_point("agent")
 
@@ -123,3 +154,45 @@ def build_graph():
     # Compile the graph into a runnable application
     app = graph.compile()
     return app
+
+
+def _tool_node(tool):
+    """
+    Wraps a state-aware tool as a graph node that runs it directly, without
+    going through the LLM router.
+    """
+    async def node(state: AgentState):
+        with observe_tool(tool.name):
+            return await tool.ainvoke({"state": state})
+    return timed_node(tool.name, node)
+
+
+PIPELINE_SEARCH_STEPS = ["embed_idea", "patent_search", "scholar_search", "search_web"]
+
+
+def build_pipeline_graph():
+    """
+    Builds a deterministic fast-path graph that runs the tools as a static DAG:
+    parse_idea, then the idea embedding and the three searches in parallel,
+    then compare_similarity and summarize_results. No LLM calls are spent on
+    choosing the next tool.
+    """
+    graph = StateGraph(AgentState)
+    for name, tool in tool_map.items():
+        graph.add_node(name, _tool_node(tool))
+
+    graph.add_edge(START, "parse_idea")
+    for name in PIPELINE_SEARCH_STEPS:
+        graph.add_edge("parse_idea", name)
+    # compare_similarity waits for every parallel branch to finish.
+    graph.add_edge(PIPELINE_SEARCH_STEPS, "compare_similarity")
+    graph.add_edge("compare_similarity", "summarize_results")
+    graph.add_edge("summarize_results", END)
+
+    return graph.compile()
+
+
+GRAPH_BUILDERS = {
+    "agent": build_graph,
+    "pipeline": build_pipeline_graph,
+}
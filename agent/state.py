@@ -1,18 +1,45 @@
 from typing import TypedDict, Annotated, List, Optional, Dict
 from langchain_core.messages import BaseMessage
+import numpy as np
 
 
 def add_messages(left: list, right: list) -> list:
-    """Add messages to the state."""
+    """
+    Add messages to the state. LangGraph shares channel values between
+    snapshots of a run, so the history is never extended in place; empty
+    updates return the existing list without copying it.
+    """
+    if not right:
+        return left if left is not None else []
+    if not left:
+        return list(right)
     return left + right
 
 
+def merge_search_results(left: Optional[Dict], right: Optional[Dict]) -> Dict:
+    """Merge per-source search results so concurrent tools don't clobber each other."""
+    if not left:
+        return dict(right or {})
+    if not right:
+        return left
+    return {**left, **right}
+
+
+def merge_missing_sources(left: Optional[List[str]], right: Optional[List[str]]) -> List[str]:
+    """Collect the sources that ran out of time, across concurrent tools."""
+    return sorted(set(left or []) | set(right or []))
+
+
 class AgentState(TypedDict):
     original_idea: str
     parsed: Optional[Dict]
-    embedding: Optional[List[float]]
-    search_results: Optional[Dict]
+    # float32 vector; search results carry theirs under "embedding" too.
+    embedding: Optional[np.ndarray]
+    search_results: Annotated[Optional[Dict], merge_search_results]
     matches: Optional[List[Dict]]
     verdict: Optional[str]
     messages: Annotated[List[BaseMessage], add_messages]
     tool_invocation_count: Dict[str, int]
+    # Monotonic-clock time by which the check must finish.
+    deadline: Optional[float]
+    missing_sources: Annotated[Optional[List[str]], merge_missing_sources]
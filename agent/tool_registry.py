@@ -1,13 +1,25 @@
-from utils.similarity import calculate_cosine_similarity
-from services.embeddings import get_embedding
+from utils.deadline import (
+    SUMMARY_RESERVE_SECONDS,
+    DeadlineExceeded,
+    expired,
+    reserve_before,
+    run_with_deadline,
+)
+from utils.keywords import parse_locally
+from utils.metrics import IDEA_PARSES, LLM_METRICS_HANDLER
+from utils.similarity import rank_by_similarity
+from services.embeddings import embedding_space, get_embedding
 from services.search_web import get_web_search_results
 from services.search_patent import search_patent
 from services.search_scholar import search_scholar
+from services.search_cache import get_search_cache
+from services.verdict_cache import get_verdict_cache
+from services.resilience import UpstreamError
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -20,8 +32,54 @@ sys.path.append(str(Path(__file__).parent.parent))
 # Import async services
 # from services.search_products import search_products_on_website # This was a mock
 
-# Initialize the async model
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
+_llm = None
+
+
+def get_llm():
+    """
+    Returns the model used to parse ideas and write verdicts, created on
+    first use so importing the tools doesn't load the OpenAI SDK.
+    """
+    global _llm
+    if _llm is None:
+        from langchain_openai import ChatOpenAI
+        _llm = ChatOpenAI(model="gpt-4o", temperature=0, stream_usage=True,
+                          callbacks=[LLM_METRICS_HANDLER])
+    return _llm
+
+# Run metadata flag marking the verdict LLM call, so streaming endpoints can
+# forward its tokens and skip the router's.
+VERDICT_STREAM_KEY = "stream_verdict"
+
+SIMILARITY_THRESHOLD = 0.5
+# Upper bound on matches kept in state; only the top 5 reach the summary.
+MAX_MATCHES = int(os.getenv("MAX_MATCHES", "50"))
+# Extract the summary and keywords locally and only ask the model when that
+# result is too thin. In pipeline mode the searches then start without
+# waiting on any LLM call; in agent mode the router's call still comes first.
+LOCAL_IDEA_PARSE = os.getenv("LOCAL_IDEA_PARSE", "0") == "1"
+# Most keyword phrases joined into the search query of a local parse.
+MAX_QUERY_KEYWORDS = 4
+
+# How sources that ran out of time are named in the verdict.
+MISSING_SOURCE_LABELS = {
+    "embedding": "similarity scoring",
+    "patents": "patents (PatentsView)",
+    "scholar": "academic papers (Semantic Scholar)",
+    "web": "web results",
+}
+
+
+def search_deadline(state: dict):
+    """
+    Deadline for the embedding and search steps: the check's deadline minus
+    the time reserved for writing the verdict.
+    """
+    return reserve_before(state.get("deadline"), SUMMARY_RESERVE_SECONDS)
+
+
+def describe_missing(missing: list) -> str:
+    return ", ".join(MISSING_SOURCE_LABELS.get(source, source) for source in missing)
 
 
 class ParsedIdea(BaseModel):
@@ -37,13 +95,26 @@ async def parse_idea(state: dict) -> dict:
     """
     Parses the user's invention idea to extract a summary and keywords.
     """
+    if LOCAL_IDEA_PARSE:
+        parsed = parse_locally(state['original_idea'])
+        if parsed is not None:
+            IDEA_PARSES.labels("local").inc()
+            return {"parsed": parsed}
+
     prompt = ChatPromptTemplate.from_messages([
         ("system", "You are an expert at understanding invention ideas. Your task is to parse the user's idea into a structured format. Extract a concise summary and a list of relevant keywords."),
         ("human", "Here is the invention idea:\n\n{idea}")
     ])
-    structured_llm = llm.with_structured_output(ParsedIdea)
+    structured_llm = get_llm().with_structured_output(ParsedIdea)
     chain = prompt | structured_llm
-    result = await chain.ainvoke({"idea": state['original_idea']})
+    try:
+        result = await run_with_deadline(
+            chain.ainvoke({"idea": state['original_idea']}), search_deadline(state))
+    except DeadlineExceeded:
+        # Search with the idea as written rather than not at all.
+        IDEA_PARSES.labels("original").inc()
+        return {"parsed": {"summary": state['original_idea'], "keywords": []}}
+    IDEA_PARSES.labels("llm").inc()
     return {"parsed": result.dict()}
 
 
@@ -55,22 +126,61 @@ async def embed_idea(state: dict) -> dict:
     summary = state.get("parsed", {}).get("summary")
     if not summary:
         return {"embedding": None}
-    embedding = await get_embedding(summary)
+    try:
+        embedding = await get_embedding(summary, deadline=search_deadline(state))
+    except DeadlineExceeded:
+        embedding = None
+    if embedding is None:
+        return {"embedding": None, "missing_sources": ["embedding"]}
+
+    # A near-duplicate of a past idea reuses its verdict and ends the run.
+    cached = await asyncio.to_thread(get_verdict_cache().lookup_similar, embedding)
+    if cached is not None:
+        return {"embedding": embedding, "verdict": cached.verdict, "matches": cached.matches}
     return {"embedding": embedding}
 
 
+def search_query(parsed: dict) -> str:
+    """
+    Query sent to the search services: the idea's summary, or for a local
+    parse (whose keywords are ranked best first) its top keywords.
+    """
+    keywords = parsed.get("keywords") or []
+    if parsed.get("parser") == "local" and keywords:
+        return " ".join(keywords[:MAX_QUERY_KEYWORDS])
+    return parsed.get("summary") or ""
+
+
+async def _search_source(state: dict, source: str, search) -> dict:
+    """
+    Runs `search(query, deadline)` for one source through the search cache.
+    A source that is unavailable or has not answered by the search deadline
+    is reported in `missing_sources` and the check goes on without it.
+    """
+    query = search_query(state.get("parsed", {}))
+    if not query:
+        return {"search_results": {source: "No summary to search."}}
+    deadline = search_deadline(state)
+    try:
+        results = await run_with_deadline(
+            get_search_cache().cached(source, query, lambda: search(query, deadline),
+                                      embeddings=embedding_space()),
+            deadline)
+    except (DeadlineExceeded, UpstreamError):
+        results = None
+    # Services swallow their own timeouts and return nothing.
+    if results is None or (not results and expired(deadline)):
+        return {"search_results": {source: []}, "missing_sources": [source]}
+    return {"search_results": {source: results}}
+
+
 @tool
 async def patent_search(state: dict) -> dict:
     """
     Searches for patents based on the parsed idea using the PatentView API.
     """
-    summary = state.get("parsed", {}).get("summary")
-    if not summary:
-        return {"search_results": {"patents": "No summary to search."}}
-    results = await search_patent(summary)
-    current_results = state.get("search_results", {})
-    current_results["patents"] = results
-    return {"search_results": current_results}
+    return await _search_source(
+        state, "patents", lambda q, deadline: search_patent(q, deadline=deadline))
 
 
 @tool
@@ -78,13 +188,8 @@ async def scholar_search(state: dict) -> dict:
     """
     Searches for academic papers on Semantic Scholar based on the parsed idea.
     """
-    summary = state.get("parsed", {}).get("summary")
-    if not summary:
-        return {"search_results": {"scholar": "No summary to search."}}
-    results = await search_scholar(summary)
-    current_results = state.get("search_results", {})
-    current_results["scholar"] = results
-    return {"search_results": current_results}
+    return await _search_source(
+        state, "scholar", lambda q, deadline: search_scholar(q, deadline=deadline))
 
 
 @tool
@@ -92,13 +197,8 @@ async def search_web(state: dict) -> dict:
     """
     Searches the web for information related to the parsed idea.
     """
-    summary = state.get("parsed", {}).get("summary")
-    if not summary:
-        return {"search_results": {"web": "No summary to search."}}
-    results = await get_web_search_results(summary)
-    current_results = state.get("search_results", {})
-    current_results["web"] = results
-    return {"search_results": current_results}
+    return await _search_source(
+        state, "web", lambda q, deadline: get_web_search_results(q, deadline=deadline))
 
 
 @tool
@@ -106,31 +206,44 @@ async def compare_similarity(state: dict) -> dict:
     """
     Compares the similarity between the user's idea and the search results.
     """
+    if state.get("verdict"):
+        # The verdict cache already answered; keep its matches.
+        return {}
+
     idea_embedding = state.get("embedding")
-    if not idea_embedding:
+    if idea_embedding is None:
         return {"matches": []}
 
     search_results = state.get("search_results", {})
-    all_matches = []
-    SIMILARITY_THRESHOLD = 0.5
+    candidates = []
+    embeddings = []
+    unembedded = 0
 
     for source, results in search_results.items():
         if not isinstance(results, list):
             continue
         for result in results:
             result_embedding = result.get('embedding')
-            if result_embedding:
-                similarity = calculate_cosine_similarity(
-                    idea_embedding, result_embedding)
-                if similarity > SIMILARITY_THRESHOLD:
-                    all_matches.append({
-                        "type": source,
-                        "details": result,
-                        "similarity": similarity
-                    })
-
-    sorted_matches = sorted(
-        all_matches, key=lambda x: x['similarity'], reverse=True)
+            if result_embedding is not None:
+                candidates.append((source, result))
+                embeddings.append(result_embedding)
+            else:
+                unembedded += 1
+
+    if not candidates and unembedded:
+        # Results were found but could not be embedded, so nothing was scored.
+        return {"matches": [], "missing_sources": ["embedding"]}
+
+    indices, scores = rank_by_similarity(
+        idea_embedding, embeddings, threshold=SIMILARITY_THRESHOLD, top_k=MAX_MATCHES)
+    sorted_matches = [
+        {
+            "type": candidates[i][0],
+            "details": candidates[i][1],
+            "similarity": float(score),
+        }
+        for i, score in zip(indices, scores)
+    ]
     return {"matches": sorted_matches}
 
 
@@ -139,11 +252,28 @@ async def summarize_results(state: dict) -> dict:
     """
     Summarizes the findings and provides a final verdict based on a structured output spec.
     """
+    if state.get("verdict"):
+        # The verdict cache already answered.
+        return {}
+
     original_idea = state.get("original_idea", "No original idea provided.")
     matches = state.get("matches", [])
+    # Partial verdicts are returned but never cached.
+    missing = state.get("missing_sources") or []
+    missing_note = (
+        f"\n\n_Note: {describe_missing(missing)} could not be searched (unavailable "
+        "or too slow), so this verdict is based on partial results._"
+        if missing else ""
+    )
 
     if not matches:
-        return {"verdict": "Verdict: Likely original\n\nNo similar inventions, products, or academic papers were found. The idea appears to be unique based on the conducted search."}
+        if missing:
+            verdict = "Verdict: Inconclusive\n\nNo similar inventions, products, or academic papers were found in the sources that responded. Please try again for a complete check." + missing_note
+            return {"verdict": verdict}
+        verdict = "Verdict: Likely original\n\nNo similar inventions, products, or academic papers were found. The idea appears to be unique based on the conducted search."
+        await asyncio.to_thread(
+            get_verdict_cache().store, original_idea, state.get("embedding"), verdict, matches)
+        return {"verdict": verdict}
 
     # Format the top 5 matches for the prompt
     formatted_matches = ""
@@ -191,6 +321,11 @@ async def summarize_results(state: dict) -> dict:
       [Link: clickable link to source 3]
     ...and so on for the top findings.
     """
+    if missing:
+        prompt_text += (
+            f"\n    These sources could not be searched and are missing from the results: "
+            f"{describe_missing(missing)}. Say so in the summary.\n"
+        )
 
     messages = [
         SystemMessage(
@@ -198,6 +333,37 @@ async def summarize_results(state: dict) -> dict:
         ),
         HumanMessage(content=prompt_text),
     ]
-    response = await llm.ainvoke(messages)
-
+    try:
+        response = await run_with_deadline(
+            get_llm().ainvoke(messages, config={"metadata": {VERDICT_STREAM_KEY: True}}),
+            state.get("deadline"))
+    except DeadlineExceeded:
+        return {"verdict": fallback_verdict(matches) + missing_note}
+
+    if missing:
+        return {"verdict": response.content + missing_note}
+    await asyncio.to_thread(
+        get_verdict_cache().store, original_idea, state.get("embedding"), response.content, matches)
     return {"verdict": response.content}
+
+
+def fallback_verdict(matches: list) -> str:
+    """
+    Verdict used when the summary model runs out of time: the closest matches
+    without the model's analysis.
+    """
+    lines = [
+        "**Verdict:** Possibly overlapping",
+        "",
+        "**Summary:** The analysis ran out of time. These are the most similar "
+        "items found; review them to judge the overlap.",
+        "",
+        "**Top Findings:**",
+    ]
+    for match in matches[:5]:
+        details = match.get("details", {})
+        title = details.get("title") or details.get("name", "No Title")
+        link = details.get("url") or details.get("link", "#")
+        lines.append(f"- **{title}** (similarity {match.get('similarity', 0.0):.2f})")
+        lines.append(f"  [Link]({link})")
+    return "\n".join(lines)
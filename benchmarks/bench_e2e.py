@@ -0,0 +1,214 @@
+"""
+End-to-end load benchmark. Starts the upstream stubs in a subprocess, points
+the app at them and drives `main.app` in-process at increasing concurrency.
+
+    python -m benchmarks.bench_e2e --mode pipeline --concurrency 1,8,32
+    python -m benchmarks.bench_e2e --latency openai_chat=1500:0.6 --fail tavily=0.1
+
+Every check uses a distinct idea, so the caches only help within one check.
+The client-side upstream rate limits and budgets are lifted so the run
+measures the app rather than its quota protection; pass
+--keep-upstream-limits to apply the production limits to the stubs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.stubs import UPSTREAMS, add_stub_arguments, stub_arguments, upstream_env
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+IDEA_WORDS = (
+    "solar bicycle helmet drone battery coffee mug thermal sensor garden irrigation "
+    "wireless charger pet feeder smart lock fingerprint backpack camera water bottle "
+    "filter kitchen scale nutrition tracker umbrella wind resistant modular shelf "
+    "magnetic phone stand posture chair vibration alarm clock sunrise lamp compost "
+    "bin odor shoe insole pressure heating glove ski goggles display keyboard folding"
+).split()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_idea(rng: random.Random) -> str:
+    words = rng.sample(IDEA_WORDS, 6)
+    return (f"A {words[0]} {words[1]} that combines a {words[2]} and a {words[3]} "
+            f"with a {words[4]} to help with {words[5]}.")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def start_stubs(args, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stubs", "--port", str(port), *stub_arguments(args)])
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/_stats", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("Upstream stubs did not start.")
+
+
+# Client-side rate and burst per upstream unless --keep-upstream-limits.
+UNLIMITED_RATE = "1000"
+
+
+def configure_environment(stub_url: str, workdir: str, keep_upstream_limits: bool = False):
+    """
+    Must run before `main` is imported: the services read their settings at
+    import time.
+    """
+    os.environ.update(upstream_env(stub_url))
+    if not keep_upstream_limits:
+        for name in UPSTREAMS:
+            prefix = name.upper()
+            os.environ[f"{prefix}_RATE_PER_SECOND"] = UNLIMITED_RATE
+            os.environ[f"{prefix}_BURST"] = UNLIMITED_RATE
+            os.environ[f"{prefix}_BUDGET"] = ""
+    for key in ("OPENAI_API_KEY", "TAVILY_API_KEY", "PATENTSVIEW_API_KEY", "SEMANTIC_SCHOLAR_API_KEY"):
+        os.environ[key] = "benchmark"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["SEARCH_CACHE_PATH"] = ""
+    os.environ["VERDICT_CACHE_PATH"] = os.path.join(workdir, "verdicts.sqlite3")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+
+async def run_level(client, stats_client, concurrency, count, mode, endpoint, rng):
+    await stats_client.post("/_reset")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json={"idea": make_idea(rng), "mode": mode})
+                # Drain streaming endpoints so the timing covers the whole run.
+                body = response.text
+                failed = response.status_code != 200 or "event: error" in body
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            if failed:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    wall = time.perf_counter() - started
+
+    upstream = (await stats_client.get("/_stats")).json()
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "concurrency": concurrency,
+        "checks": count,
+        "errors": errors,
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "throughput_per_s": round(count / wall, 2),
+        "upstream_calls_per_check": {
+            name: round(calls / count, 2) for name, calls in sorted(upstream["calls"].items())},
+        "upstream_failures": upstream["failures"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_level(result: dict):
+    rss = result["peak_rss_mb"]
+    print(f"c={result['concurrency']:<4} n={result['checks']:<5} err={result['errors']:<4} "
+          f"p50={result['p50_ms']:>8.1f}ms p95={result['p95_ms']:>8.1f}ms "
+          f"p99={result['p99_ms']:>8.1f}ms {result['throughput_per_s']:>7.2f} checks/s "
+          f"peak_rss={'n/a' if rss is None else f'{rss:.0f}MB'}")
+    calls = ", ".join(f"{name}={value}" for name, value in result["upstream_calls_per_check"].items())
+    print(f"       upstream calls/check: {calls}")
+    if result["upstream_failures"]:
+        failures = ", ".join(f"{name}={value}" for name, value in sorted(result["upstream_failures"].items()))
+        print(f"       injected upstream failures: {failures}")
+
+
+async def run(args, stub_url):
+    import main as app_module
+
+    # The benchmark is the only client; per-IP limits would reject it.
+    app_module.limiter.enabled = False
+    app = app_module.app
+    endpoint = {"check": "/check", "stream": "/check/stream"}[args.endpoint]
+    rng = random.Random(args.seed)
+    results = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client, \
+                httpx.AsyncClient(base_url=stub_url) as stats_client:
+            for concurrency in args.concurrency:
+                count = args.requests or max(concurrency * 4, 20)
+                result = await run_level(
+                    client, stats_client, concurrency, count, args.mode, endpoint, rng)
+                print_level(result)
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=["agent", "pipeline"], default="pipeline")
+    parser.add_argument("--endpoint", choices=["check", "stream"], default="check")
+    parser.add_argument(
+        "--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16, 64],
+        help="Comma-separated concurrency levels (default: 1,4,16,64)")
+    parser.add_argument(
+        "--requests", type=int, default=0,
+        help="Checks per level (default: 4x the concurrency, at least 20)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument(
+        "--keep-upstream-limits", action="store_true",
+        help="Apply the production client-side upstream rate limits and budgets")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    port = free_port()
+    stub_url = f"http://127.0.0.1:{port}"
+    stubs = start_stubs(args, port)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure_environment(stub_url, workdir, args.keep_upstream_limits)
+            print(f"mode={args.mode} endpoint={args.endpoint}")
+            results = asyncio.run(run(args, stub_url))
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "endpoint": args.endpoint, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Cold-start benchmark. Imports the app in fresh interpreters with
+`python -X importtime` and reports the slowest modules and packages, the
+total import time and the time `main.warm_up()` takes to compile the graphs
+and load the model clients.
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --runs 10 --top 30 --budget-ms 1500
+
+Import times are measured under -X importtime, which adds a little
+overhead. With --budget-ms the exit status is 1 when the median import time
+is over budget, so the check can run in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Runs in the child interpreter; prints its timings as JSON on stdout.
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import {module} as module
+imported = time.perf_counter()
+sys.stderr.write("{marker}\\n")
+warm_up = None
+if {warm_up} and hasattr(module, "warm_up"):
+    module.warm_up()
+    warm_up = time.perf_counter() - imported
+print(json.dumps({{"import": imported - started, "warm_up": warm_up}}))
+"""
+# Written to stderr once the module is imported; what warm_up() imports
+# after it isn't part of the import time.
+MARKER = "bench_import: imported"
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parses `-X importtime` output into (module, self us, cumulative us)
+    tuples, in the order the imports finished, up to MARKER.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if line == MARKER:
+            break
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def run_once(module: str, warm_up: bool) -> dict:
+    env = dict(os.environ)
+    # The model clients are only constructed, never called.
+    env.setdefault("OPENAI_API_KEY", "bench")
+    code = CHILD.format(module=module, warm_up=warm_up, marker=MARKER)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["imports"] = parse_importtime(result.stderr)
+    return timings
+
+
+def summarize(runs: list, module: str) -> dict:
+    """
+    Median self and cumulative time per module, and self time summed per
+    top-level package, over the runs.
+    """
+    self_us = defaultdict(list)
+    cumulative_us = defaultdict(list)
+    packages = defaultdict(lambda: [0] * len(runs))
+    for i, run in enumerate(runs):
+        for name, own, cumulative in run["imports"]:
+            self_us[name].append(own)
+            cumulative_us[name].append(cumulative)
+            packages[name.split(".")[0]][i] += own
+    modules = {
+        name: {"self_ms": statistics.median(own) / 1000,
+               "cumulative_ms": statistics.median(cumulative_us[name]) / 1000}
+        for name, own in self_us.items()
+    }
+    warm_ups = [run["warm_up"] for run in runs if run["warm_up"] is not None]
+    return {
+        "module": module,
+        "runs": len(runs),
+        "import_ms": statistics.median(run["import"] for run in runs) * 1000,
+        "module_cumulative_ms": modules.get(module, {}).get("cumulative_ms"),
+        "warm_up_ms": statistics.median(warm_ups) * 1000 if warm_ups else None,
+        "modules_imported": len(modules),
+        "modules": modules,
+        "packages": {name: statistics.median(times) / 1000 for name, times in packages.items()},
+    }
+
+
+def print_summary(summary: dict, top: int):
+    print(f"{summary['module']}: {summary['import_ms']:.0f} ms to import "
+          f"({summary['modules_imported']} modules, median of {summary['runs']} runs)")
+    if summary["warm_up_ms"] is not None:
+        print(f"warm_up(): {summary['warm_up_ms']:.0f} ms")
+
+    print("\nslowest modules (cumulative includes the modules they import):")
+    print(f"{'self ms':>9} {'cumul. ms':>10}  module")
+    modules = sorted(summary["modules"].items(), key=lambda item: -item[1]["cumulative_ms"])
+    for name, times in modules[:top]:
+        print(f"{times['self_ms']:9.1f} {times['cumulative_ms']:10.1f}  {name}")
+
+    print("\nslowest packages (self time of all their modules):")
+    packages = sorted(summary["packages"].items(), key=lambda item: -item[1])
+    for name, ms in packages[:top]:
+        print(f"{ms:9.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time (default: 5)")
+    parser.add_argument("--top", type=int, default=20, help="Modules and packages to list (default: 20)")
+    parser.add_argument("--no-warm-up", action="store_true", help="Don't time main.warm_up()")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median import takes longer")
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    # The first run writes the bytecode caches; a deployed image ships them.
+    run_once(args.module, warm_up=False)
+    runs = [run_once(args.module, warm_up=not args.no_warm_up) for _ in range(args.runs)]
+    summary = summarize(runs, args.module)
+    print_summary(summary, args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.budget_ms is not None:
+        verdict = "within" if summary["import_ms"] <= args.budget_ms else "over"
+        print(f"\nimport budget {args.budget_ms:.0f} ms: {verdict}")
+        if verdict == "over":
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Microbenchmarks for the CPU-bound scoring steps: `compare_similarity` over
+search results (with float32 and int8 embeddings, and the memory they take)
+and the BM25 candidate selection that runs before embedding.
+
+    python -m benchmarks.bench_scoring
+"""
+import asyncio
+import os
+import random
+import timeit
+
+import numpy as np
+
+# tool_registry creates its chat model at import time.
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from agent.tool_registry import compare_similarity  # noqa: E402
+from utils.retrieval import select_candidates  # noqa: E402
+from utils.vectors import to_embedding  # noqa: E402
+
+DIMENSIONS = 1536
+QUERY = "A self-heating coffee mug with a battery powered ceramic heating element and temperature sensor"
+VOCABULARY = (
+    "mug coffee heating element battery ceramic temperature sensor thermal insulated "
+    "vessel beverage container lid handle controller circuit wireless charging base "
+    "apparatus housing layer surface plurality assembly portion member configured"
+).split()
+
+
+def make_state(candidates_per_source: int, rng: np.random.Generator, dtype) -> dict:
+    idea = to_embedding(rng.standard_normal(DIMENSIONS), dtype)
+    search_results = {}
+    for source in ("patents", "scholar", "web"):
+        search_results[source] = [
+            {
+                "title": f"{source} result {i}",
+                "snippet": "",
+                "link": "",
+                "embedding": to_embedding(rng.standard_normal(DIMENSIONS), dtype),
+            }
+            for i in range(candidates_per_source)
+        ]
+    return {"embedding": idea, "search_results": search_results}
+
+
+def make_candidates(count: int, rng: random.Random) -> list:
+    return [
+        {
+            "title": " ".join(rng.sample(VOCABULARY, 6)),
+            "snippet": " ".join(rng.choices(VOCABULARY, k=120)),
+            "link": f"https://example.com/{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def bench_compare_similarity():
+    rng = np.random.default_rng(0)
+    loop = asyncio.new_event_loop()
+    try:
+        for dtype in (np.float32, np.int8):
+            for per_source in (5, 50, 500):
+                state = make_state(per_source, rng, dtype)
+                number = max(10, 2000 // per_source)
+                # Call the tool's coroutine directly so LangChain's input
+                # validation is not part of the measurement.
+                run = lambda: loop.run_until_complete(compare_similarity.coroutine(state))
+                seconds = timeit.timeit(run, number=number)
+                kib = sum(r["embedding"].nbytes for results in state["search_results"].values()
+                          for r in results) / 1024
+                print(f"compare_similarity {np.dtype(dtype).name:>7} {per_source * 3:>5} candidates: "
+                      f"{seconds / number * 1e3:8.3f} ms/call, {kib:8.1f} KiB of embeddings")
+    finally:
+        loop.close()
+
+
+def bench_select_candidates(number=200):
+    rng = random.Random(0)
+    for count in (15, 50, 150, 1000):
+        candidates = make_candidates(count, rng)
+        repeat = max(10, number * 15 // count)
+        run = lambda: select_candidates(QUERY, candidates, 5)
+        seconds = timeit.timeit(run, number=repeat)
+        print(f"select_candidates  {count:>5} candidates: {seconds / repeat * 1e3:8.3f} ms/call")
+
+
+def main():
+    bench_compare_similarity()
+    bench_select_candidates()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Local stand-ins for OpenAI, PatentsView, Semantic Scholar and Tavily, used by
+the end-to-end benchmark. Every upstream answers after a latency drawn from a
+lognormal distribution and fails (503) or rate-limits (429 with Retry-After)
+with configurable probabilities.
+
+    python -m benchmarks.stubs --port 8765 --latency openai_chat=800:0.4 --fail tavily=0.05
+
+Point the app at it with OPENAI_BASE_URL, PATENTSVIEW_API_URL,
+SEMANTIC_SCHOLAR_API_URL and TAVILY_API_URL (see `upstream_env`).
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+UPSTREAMS = ("openai_chat", "openai_embeddings", "patentsview", "semantic_scholar", "tavily")
+
+# Median latency in milliseconds and lognormal sigma per upstream.
+DEFAULT_LATENCY = {
+    "openai_chat": (700.0, 0.4),
+    "openai_embeddings": (120.0, 0.3),
+    "patentsview": (450.0, 0.5),
+    "semantic_scholar": (350.0, 0.5),
+    "tavily": (900.0, 0.4),
+}
+EMBEDDING_DIMENSIONS = 1536
+# Words the generated search results are padded with.
+FILLER = (
+    "apparatus assembly configured coupled housing module sensor controller signal "
+    "surface member portion plurality layer element unit circuit material process"
+).split()
+# Order in which the stub router asks for tools; a step's tools run in parallel.
+TOOL_STEPS = [
+    ["parse_idea"],
+    ["embed_idea", "patent_search", "scholar_search", "search_web"],
+    ["compare_similarity"],
+    ["summarize_results"],
+]
+VERDICT = (
+    "**Verdict:** Possibly overlapping\n\n"
+    "**Summary:** Several existing patents and papers describe closely related "
+    "mechanisms, although none combines all of the features of this idea.\n\n"
+    "**Closest matches:** see the similar items listed above."
+)
+
+
+def upstream_env(base_url: str) -> dict:
+    """
+    Returns the environment variables that point the app at a stub server.
+    """
+    base_url = base_url.rstrip("/")
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "PATENTSVIEW_API_URL": f"{base_url}/patentsview/api/v1/patent/",
+        "SEMANTIC_SCHOLAR_API_URL": f"{base_url}/scholar/graph/v1",
+        "TAVILY_API_URL": f"{base_url}/tavily",
+    }
+
+
+def parse_overrides(values, parse):
+    overrides = {}
+    for value in values or []:
+        name, _, spec = value.partition("=")
+        if name not in UPSTREAMS:
+            raise SystemExit(f"Unknown upstream '{name}', expected one of {UPSTREAMS}")
+        overrides[name] = parse(spec)
+    return overrides
+
+
+def _latency_spec(spec: str):
+    median, _, sigma = spec.partition(":")
+    return float(median), float(sigma or 0)
+
+
+def _text_values(value) -> list:
+    """
+    The string values in a PatentSearch query, without its operators and
+    field names, so the results depend on the searched text alone.
+    """
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [text for item in value for text in _text_values(item)]
+    return []
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[a-z]{3,}", text.lower())
+
+
+class StubUpstreams:
+    def __init__(self, latency=None, failure_rate=None, throttle_rate=None, seed=0):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.failure_rate = failure_rate or {}
+        self.throttle_rate = throttle_rate or {}
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.failures = Counter()
+        self._word_vectors = {}
+        self._tool_ids = 0
+
+    async def respond(self, upstream: str):
+        """
+        Sleeps for the upstream's latency and returns an error response when
+        this call is chosen to fail, otherwise None.
+        """
+        self.calls[upstream] += 1
+        median, sigma = self.latency[upstream]
+        delay = median * self.rng.lognormvariate(0, sigma) if sigma else median
+        await asyncio.sleep(delay / 1000)
+        if self.rng.random() < self.failure_rate.get(upstream, 0.0):
+            self.failures[upstream] += 1
+            return JSONResponse({"error": {"message": "stub failure"}}, status_code=503)
+        if self.rng.random() < self.throttle_rate.get(upstream, 0.0):
+            self.failures[upstream] += 1
+            return JSONResponse(
+                {"error": {"message": "rate limited"}}, status_code=429, headers={"Retry-After": "1"})
+        return None
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "failures": dict(self.failures)}
+
+    def reset(self):
+        self.calls.clear()
+        self.failures.clear()
+
+    # Embeddings are sums of per-word random vectors, so texts sharing words
+    # are similar and the scoring and verdict steps see realistic matches.
+    def embed(self, text: str, dimensions: int) -> np.ndarray:
+        vector = np.zeros(dimensions, dtype=np.float32)
+        for word in _words(text) or ["empty"]:
+            key = (word, dimensions)
+            word_vector = self._word_vectors.get(key)
+            if word_vector is None:
+                seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+                word_vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+                self._word_vectors[key] = word_vector
+            vector += word_vector
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def results_for(self, query: str, count: int) -> list:
+        """
+        Returns `count` (title, abstract) pairs that share some words with
+        the query.
+        """
+        words = _words(query) or ["invention"]
+        rng = random.Random(query)
+        results = []
+        for i in range(count):
+            shared = rng.sample(words, k=max(1, min(len(words), rng.randint(1, 4))))
+            title = " ".join(shared + rng.sample(FILLER, 2)).capitalize()
+            abstract = " ".join(rng.sample(words, k=min(len(words), 6)) + rng.sample(FILLER, 8))
+            results.append((f"{title} {i}", f"A {abstract}."))
+        return results
+
+    def next_tool_calls(self, messages: list) -> list:
+        done = set()
+        for message in messages:
+            for call in message.get("tool_calls") or []:
+                done.add(call["function"]["name"])
+        for step in TOOL_STEPS:
+            pending = [name for name in step if name not in done]
+            if pending:
+                calls = []
+                for name in pending:
+                    self._tool_ids += 1
+                    calls.append({
+                        "id": f"call_{self._tool_ids}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps({"state": {}})},
+                    })
+                return calls
+        return []
+
+
+def _structured_content(schema: dict, text: str) -> str:
+    # Drop the prompt's lead-in ("Here is the invention idea:") so keywords
+    # come from the idea itself.
+    text = text.split("\n\n")[-1]
+    words = _words(text)
+    summary = " ".join(text.split()[:40])
+    values = {}
+    for name, prop in (schema.get("properties") or {}).items():
+        values[name] = list(dict.fromkeys(words))[:8] if prop.get("type") == "array" else summary
+    return json.dumps(values)
+
+
+def _last_user_text(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content)
+            return (content or "").replace("<<<USER_IDEA>>>", "").replace("<<<END_USER_IDEA>>>", "")
+    return ""
+
+
+def _usage(messages: list, completion: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    completion_tokens = max(1, len(completion) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(stubs: StubUpstreams) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/_stats")
+    async def stats():
+        return stubs.stats()
+
+    @app.post("/_reset")
+    async def reset():
+        stubs.reset()
+        return stubs.stats()
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = await stubs.respond("openai_chat")
+        if error is not None:
+            return error
+
+        messages = body.get("messages", [])
+        content, tool_calls = "", []
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"].get("schema", {})
+            content = _structured_content(schema, _last_user_text(messages))
+        elif body.get("tools"):
+            tool_calls = stubs.next_tool_calls(messages)
+            if not tool_calls:
+                content = "Done."
+        else:
+            content = VERDICT
+
+        usage = _usage(messages, content + json.dumps(tool_calls))
+        completion_id = f"chatcmpl-{stubs.calls['openai_chat']}"
+        created = int(time.time())
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        message = {"role": "assistant", "content": content or None}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        if not body.get("stream"):
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        def chunk(delta, finish=None, usage_payload=None):
+            payload = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": body.get("model"),
+                "choices": [] if usage_payload else [
+                    {"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if usage_payload:
+                payload["usage"] = usage_payload
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            yield chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                yield chunk({"tool_calls": [{"index": i, **call} for i, call in enumerate(tool_calls)]})
+            else:
+                for piece in re.findall(r"\S+\s*", content):
+                    yield chunk({"content": piece})
+            yield chunk({}, finish=finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk({}, usage_payload=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/openai/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        error = await stubs.respond("openai_embeddings")
+        if error is not None:
+            return error
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+        data = []
+        for i, text in enumerate(inputs):
+            vector = stubs.embed(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(text) // 4 for text in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/patentsview/api/v1/patent/")
+    async def patents(request: Request):
+        body = await request.json()
+        error = await stubs.respond("patentsview")
+        if error is not None:
+            return error
+        query = " ".join(_text_values(body.get("q", {})))
+        size = (body.get("o") or {}).get("size", 15)
+        return {"patents": [
+            {
+                "patent_id": f"{10000000 + i}",
+                "patent_title": title,
+                "patent_abstract": abstract,
+                "patent_date": "2019-06-04",
+                "inventors": [],
+                "patent_num_times_cited_by_us_patents": (i * 7) % 40,
+            }
+            for i, (title, abstract) in enumerate(stubs.results_for(query, size))
+        ]}
+
+    @app.get("/scholar/graph/v1/paper/search")
+    async def papers(query: str = "", limit: int = 5):
+        error = await stubs.respond("semantic_scholar")
+        if error is not None:
+            return error
+        return {"data": [
+            {
+                "title": title,
+                "abstract": abstract,
+                "url": f"https://www.semanticscholar.org/paper/{i}",
+                "authors": [{"name": "A. Author"}],
+                "year": 2018 + i % 6,
+                "citationCount": i * 3,
+            }
+            for i, (title, abstract) in enumerate(stubs.results_for(query, limit))
+        ]}
+
+    @app.post("/tavily/search")
+    async def web_search(request: Request):
+        body = await request.json()
+        error = await stubs.respond("tavily")
+        if error is not None:
+            return error
+        results = stubs.results_for(body.get("query", ""), body.get("max_results", 10))
+        return {"query": body.get("query"), "results": [
+            {"title": title, "content": abstract, "url": f"https://example.com/{i}", "score": 0.5}
+            for i, (title, abstract) in enumerate(results)
+        ]}
+
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--latency", action="append", metavar="UPSTREAM=MEDIAN_MS[:SIGMA]",
+        help="Lognormal latency per upstream, e.g. openai_chat=800:0.4 (repeatable)")
+    parser.add_argument(
+        "--fail", action="append", metavar="UPSTREAM=RATE",
+        help="Fraction of calls that fail with a 503, e.g. tavily=0.05 (repeatable)")
+    parser.add_argument(
+        "--throttle", action="append", metavar="UPSTREAM=RATE",
+        help="Fraction of calls answered with a 429 and Retry-After: 1 (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def stub_arguments(args) -> list:
+    """
+    Turns parsed stub options back into command-line arguments.
+    """
+    argv = ["--seed", str(args.seed)]
+    for value in args.latency or []:
+        argv += ["--latency", value]
+    for value in args.fail or []:
+        argv += ["--fail", value]
+    for value in args.throttle or []:
+        argv += ["--throttle", value]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    stubs = StubUpstreams(
+        latency=parse_overrides(args.latency, _latency_spec),
+        failure_rate=parse_overrides(args.fail, float),
+        throttle_rate=parse_overrides(args.throttle, float),
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(stubs), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -49,7 +49,7 @@ async function handleFormSubmit(e) {
     submitButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Checking...';
 
     try {
-        const response = await fetch('/check', {
+        const response = await fetch('/check/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -78,8 +78,30 @@ async function handleFormSubmit(e) {
             throw err;
         }
 
-        const data = await response.json();
-        const finalSummary = data.summary;
+        resultsContent.innerHTML = `
+            <ul class="progress-list"></ul>
+            <div class="stream-output"></div>
+            <div class="spinner"></div>
+        `;
+        const progressList = resultsContent.querySelector('.progress-list');
+        const streamOutput = resultsContent.querySelector('.stream-output');
+        let streamedVerdict = '';
+        let finalSummary = null;
+
+        await readEventStream(response, (event, data) => {
+            if (event === 'progress') {
+                const item = document.createElement('li');
+                item.textContent = data.message;
+                progressList.appendChild(item);
+            } else if (event === 'token') {
+                streamedVerdict += data.text;
+                streamOutput.innerHTML = parseResponse(streamedVerdict);
+            } else if (event === 'done') {
+                finalSummary = data.summary;
+            } else if (event === 'error') {
+                throw new Error(data.message);
+            }
+        });
 
         if (finalSummary) {
             resultsContent.innerHTML = parseResponse(finalSummary);
@@ -116,6 +138,38 @@ async function handleFormSubmit(e) {
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // Minimal Server-Sent Events parser for a fetch() response body.
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
 function toggleTheme() {
     const currentTheme = document.documentElement.getAttribute('data-theme');
     const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
@@ -1,170 +1,198 @@
 import os
+import asyncio
+import gc
 import json
-import re
+import logging
+import time
+from typing import Literal, Optional, get_args
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.routing import Match
 from langchain_core.messages import HumanMessage
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 
 # Load environment variables from .env file before importing modules that depend on them
 load_dotenv()
 
-from agent.graph import build_graph
+from agent.agent_node import get_router
+from agent.tool_registry import MISSING_SOURCE_LABELS, VERDICT_STREAM_KEY, get_llm
+from services.clients import init_clients, close_clients
+from services.jobs import JobStore, JobWorkerPool
+from services.rate_limits import RateLimitExceeded, get_rate_limiter, parse_limit
+from services import embedding_cache, search_cache, verdict_cache
+from services.verdict_cache import get_verdict_cache
+from utils import metrics
+from utils.deadline import new_deadline
+from utils.loop_monitor import LOOP_LAG_DEBUG, LoopLagMonitor
+from utils.prompt_guard import get_prompt_guard, is_high_risk_prompt
 
 MAX_IDEA_LENGTH = 2000
-HIGH_RISK_PATTERNS = [
-    "ignore previous",
-    "ignore the above",
-    "ignore that",
-    "ignore all previous",
-    "ignore instructions",
-    "system prompt",
-    "disregard previous",
-    "act as",
-    "you are now",
-    "forget the above",
-    "system_overridden",
-    "after you read this",
-    "real content starts below",
-    "answer only with",
-    "no matter the question",
-    "always respond with",
-    "system rules",
-    "passwords_are_here",
-    "next request must be obeyed",
-]
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_RATE_LIMIT = os.getenv("BATCH_RATE_LIMIT", "2/minute")
+# Ideas each client may submit in batches; BATCH_RATE_LIMIT only counts requests.
+BATCH_IDEA_LIMIT = os.getenv("BATCH_IDEA_LIMIT", "500/hour")
+# "agent" lets the LLM route between tools, "pipeline" runs them as a fixed DAG.
+CheckMode = Literal["agent", "pipeline"]
+CHECK_MODES = get_args(CheckMode)
+DEFAULT_CHECK_MODE = os.getenv("CHECK_MODE", "agent")
 PROMPT_BLOCK_MESSAGE = (
     "We cannot analyze that request. Please describe an invention idea instead."
 )
 
 
-def is_high_risk_prompt(text: str) -> bool:
-    lowered = text.lower()
-    if any(pattern in lowered for pattern in HIGH_RISK_PATTERNS):
-        return True
-    if "ignore" in lowered and (
-        "directions" in lowered or "instructions" in lowered or "tell me" in lowered
-    ):
-        return True
-    if "but actually" in lowered and "ignore" in lowered:
-        return True
-    if "after you read this" in lowered and "output" in lowered:
-        return True
-    if "tell me what the capital" in lowered or "tell me the capital" in lowered:
-        return True
-    if ("\"meta\"" in lowered or "'meta'" in lowered) and "ignore" in lowered:
-        return True
-    if looks_like_malicious_json(text):
-        return True
-    if contains_malicious_html_comment(text):
-        return True
-    if forces_fixed_output(lowered):
-        return True
-    if references_system_rule_override(lowered):
-        return True
-    if enforces_multi_step_override(lowered):
-        return True
-    return False
-
-
-def looks_like_malicious_json(text: str) -> bool:
-    try:
-        parsed = json.loads(text)
-    except Exception:
-        return False
-
-    if not isinstance(parsed, dict):
-        return False
-
-    for key, value in parsed.items():
-        if not isinstance(value, str):
-            continue
-        lowered_val = value.lower()
-        if any(
-            trigger in lowered_val
-            for trigger in [
-                "ignore the",
-                "ignore instructions",
-                "output hacked",
-                "system override",
-                "after you read",
-                "instead of",
-            ]
-        ):
-            return True
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the pooled upstream clients and starts the job workers once for
+    the lifetime of the app, and shuts both down on exit.
+    """
+    # Compile the screening rules up front so a broken rules file fails fast.
+    get_prompt_guard()
+    loop_monitor = LoopLagMonitor() if LOOP_LAG_DEBUG else None
+    if loop_monitor is not None:
+        loop_monitor.start()
+    app.state.clients = init_clients()
+    app.state.jobs = JobWorkerPool(JobStore(), run_check)
+    app.state.jobs.start()
+    yield
+    await app.state.jobs.stop()
+    await close_clients()
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+
+
+limiter = get_rate_limiter()
+app = FastAPI(
+    title="DoesItExist?",
+    description="An AI agent that checks if an invention idea already exists.",
+    version="0.1.0",
+    lifespan=lifespan,
+)
+app.state.limiter = limiter
 
-    return False
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"error": exc.detail},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
 
-def contains_malicious_html_comment(text: str) -> bool:
-    for match in re.findall(r"<!--(.*?)-->", text, flags=re.IGNORECASE | re.DOTALL):
-        lowered = match.lower()
-        if "ignore" in lowered or "output" in lowered or "instead" in lowered:
-            return True
-    return False
 
+metrics.CACHE_STATS.register("embeddings", embedding_cache)
+metrics.CACHE_STATS.register("search", search_cache)
+metrics.CACHE_STATS.register("verdicts", verdict_cache)
 
-def forces_fixed_output(text: str) -> bool:
-    return any(
-        phrase in text
-        for phrase in [
-            "answer only with",
-            "respond only with",
-            "no matter the question",
-            "always respond with",
-            "output exactly",
-        ]
-    )
 
+def route_path(request: Request) -> str:
+    """
+    Returns the route template a request matches (e.g. /jobs/{job_id}), so
+    metric labels don't grow with every id.
+    """
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "other")
+    return "other"
 
-def references_system_rule_override(text: str) -> bool:
-    if "system rules" in text and ("don't apply" in text or "do not apply" in text):
-        return True
-    if "your instructions say" in text and "must be obeyed" in text:
-        return True
-    if "next request must be obeyed" in text:
-        return True
-    return False
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Counts requests and records their latency per route. Streaming routes
+    are timed until their response headers are sent.
+    """
+    path = route_path(request)
+    if path in ("/metrics", "/static"):
+        return await call_next(request)
+
+    metrics.HTTP_IN_FLIGHT.labels(path).inc()
+    status = 500
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_LATENCY.labels(request.method, path).observe(time.perf_counter() - started)
+        metrics.HTTP_REQUESTS.labels(request.method, path, str(status)).inc()
+        metrics.HTTP_IN_FLIGHT.labels(path).dec()
+
+
+@app.get("/metrics")
+async def read_metrics():
+    """
+    Exposes Prometheus metrics.
+    """
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
 
-def enforces_multi_step_override(text: str) -> bool:
-    has_step_sequence = "first" in text and "second" in text and "finally" in text
-    if has_step_sequence and ("output" in text or "respond" in text):
-        return True
-    return False
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(
-    title="DoesItExist?",
-    description="An AI agent that checks if an invention idea already exists.",
-    version="0.1.0",
-)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Mount the static files directory
 static_files_path = os.path.join(os.path.dirname(__file__), "frontend/static")
 app.mount("/static", StaticFiles(directory=static_files_path), name="static")
 
-# Build the LangGraph agent
-graph = build_graph()
+if DEFAULT_CHECK_MODE not in CHECK_MODES:
+    raise ValueError(
+        f"CHECK_MODE must be one of {sorted(CHECK_MODES)}, got '{DEFAULT_CHECK_MODE}'.")
+
+# Reject a malformed limit at startup rather than on the first batch.
+parse_limit(BATCH_IDEA_LIMIT)
+
+# The LangGraph agent and the deterministic pipeline, each compiled the
+# first time it is used.
+graphs = {}
+
+
+def get_graph(mode: str):
+    if mode not in graphs:
+        # LangGraph is imported with the first graph rather than at startup.
+        from agent.graph import GRAPH_BUILDERS
+        graphs[mode] = GRAPH_BUILDERS[mode]()
+    return graphs[mode]
+
+
+def warm_up():
+    """
+    Does the fork-safe part of startup ahead of time. The production server
+    calls this in its master process before forking workers, so they share
+    the imported modules, compiled graphs and screening rules copy-on-write.
+    Nothing here opens a connection or a database; each worker creates its
+    own clients and stores in `lifespan`.
+    """
+    get_prompt_guard()
+    for mode in CHECK_MODES:
+        get_graph(mode)
+    # Load the model clients now too, rather than in the first request of
+    # every worker.
+    get_llm()
+    get_router()
+    # Keep the garbage collector from touching (and so copying) the
+    # preloaded objects in every worker.
+    gc.freeze()
 
 
 class IdeaRequest(BaseModel):
     idea: str
+    mode: Optional[CheckMode] = None
 
 
-@app.post("/check")
-@limiter.limit("5/minute")
-async def check_idea(request: Request, idea_request: IdeaRequest):
+NO_SUMMARY_MESSAGE = "The agent did not produce a final summary."
+# Setting a recursion limit to prevent infinite loops
+GRAPH_CONFIG = {"recursion_limit": 15}
+
+
+def validate_idea(idea: Optional[str]) -> str:
     """
-    Accepts an invention idea and returns the agent's verdict.
+    Normalizes the submitted idea and rejects empty, oversized or
+    prompt-injection inputs with a 400.
     """
-    user_idea = (idea_request.idea or "").strip()
+    user_idea = (idea or "").strip()
     if not user_idea:
         raise HTTPException(
             status_code=400, detail="Idea cannot be empty.")
@@ -177,14 +205,17 @@ async def check_idea(request: Request, idea_request: IdeaRequest):
             status_code=400,
             detail=PROMPT_BLOCK_MESSAGE,
         )
+    return user_idea
 
+
+def build_initial_state(user_idea: str) -> dict:
     spotlighted_idea = (
         "<<<USER_IDEA>>>\n"
         f"{user_idea}\n"
         "<<<END_USER_IDEA>>>"
     )
 
-    initial_state = {
+    return {
         "messages": [
             HumanMessage(
                 content=f"Here is my invention idea:\n{spotlighted_idea}"
@@ -192,18 +223,228 @@ async def check_idea(request: Request, idea_request: IdeaRequest):
         ],
         "original_idea": user_idea,
         "tool_invocation_count": {},
+        "deadline": new_deadline(),
     }
 
-    # Setting a recursion limit to prevent infinite loops
-    config = {"recursion_limit": 15}
 
-    final_state = await graph.ainvoke(initial_state, config=config)
+async def run_check(user_idea: str, mode: str) -> dict:
+    """
+    Runs one validated idea through the selected graph and returns the
+    response payload.
+    """
+    # Exact repeats are answered from the verdict cache without any LLM call.
+    cached = await asyncio.to_thread(get_verdict_cache().lookup_exact, user_idea)
+    if cached is not None:
+        return {"summary": cached.verdict, "cached": True}
+
+    initial_state = build_initial_state(user_idea)
+    final_state = await get_graph(mode).ainvoke(initial_state, config=GRAPH_CONFIG)
 
     # Extract the final verdict from the agent's state
-    summary = final_state.get(
-        "verdict", "The agent did not produce a final summary.")
+    summary = final_state.get("verdict", NO_SUMMARY_MESSAGE)
+
+    result = {"summary": summary}
+    if final_state.get("missing_sources"):
+        result["missing_sources"] = final_state["missing_sources"]
+    return result
+
 
-    return {"summary": summary}
+@app.post("/check")
+@limiter.limit("5/minute")
+async def check_idea(request: Request, idea_request: IdeaRequest):
+    """
+    Accepts an invention idea and returns the agent's verdict.
+    """
+    user_idea = validate_idea(idea_request.idea)
+    await limiter.charge_checks()
+    return await run_check(user_idea, idea_request.mode or DEFAULT_CHECK_MODE)
+
+
+SOURCE_LABELS = {
+    "patents": "Patents found",
+    "scholar": "Papers found",
+    "web": "Web results found",
+}
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def describe_update(node: str, update: Optional[dict]) -> list[str]:
+    """
+    Turns a node's state update into short human-readable progress lines.
+    """
+    if not update:
+        return []
+    lines = []
+    if node == "agent":
+        messages = update.get("messages") or []
+        tool_calls = getattr(messages[-1], "tool_calls", None) if messages else None
+        if tool_calls:
+            names = ", ".join(call["name"] for call in tool_calls)
+            lines.append(f"Running: {names}")
+    if update.get("parsed"):
+        keywords = update["parsed"].get("keywords") or []
+        lines.append(f"Idea parsed: {len(keywords)} keywords")
+    if update.get("embedding") is not None:
+        lines.append("Idea embedded")
+    for source, results in (update.get("search_results") or {}).items():
+        count = len(results) if isinstance(results, list) else 0
+        lines.append(f"{SOURCE_LABELS.get(source, source)}: {count}")
+    for source in update.get("missing_sources") or []:
+        lines.append(f"Unavailable: {MISSING_SOURCE_LABELS.get(source, source)}")
+    if update.get("matches") is not None:
+        lines.append(f"Similar items: {len(update['matches'])}")
+    if update.get("verdict"):
+        lines.append("Verdict ready")
+    return lines
+
+
+async def stream_check(user_idea: str, mode: str):
+    """
+    Runs the graph and yields Server-Sent Events: a `progress` event as each
+    node finishes, `token` events while the verdict is generated, and a final
+    `done` event with the complete summary.
+    """
+    cached = await asyncio.to_thread(get_verdict_cache().lookup_exact, user_idea)
+    if cached is not None:
+        yield format_sse("progress", {"node": "cache", "message": "Found a previous verdict for this idea"})
+        yield format_sse("done", {"summary": cached.verdict})
+        return
+
+    summary = None
+    missing = set()
+    try:
+        async for stream_mode, payload in get_graph(mode).astream(
+            build_initial_state(user_idea),
+            config=GRAPH_CONFIG,
+            stream_mode=["updates", "messages"],
+        ):
+            if stream_mode == "updates":
+                for node, update in payload.items():
+                    for line in describe_update(node, update):
+                        yield format_sse("progress", {"node": node, "message": line})
+                    if update and update.get("verdict"):
+                        summary = update["verdict"]
+                    if update and update.get("missing_sources"):
+                        missing.update(update["missing_sources"])
+            else:
+                chunk, metadata = payload
+                if metadata.get(VERDICT_STREAM_KEY) and chunk.content:
+                    yield format_sse("token", {"text": chunk.content})
+    except Exception:
+        logging.exception("Streaming check failed")
+        yield format_sse("error", {"message": "Something went wrong. Please try again."})
+        return
+
+    done = {"summary": summary or NO_SUMMARY_MESSAGE}
+    if missing:
+        done["missing_sources"] = sorted(missing)
+    yield format_sse("done", done)
+
+
+@app.post("/check/stream")
+@limiter.limit("5/minute")
+async def check_idea_stream(request: Request, idea_request: IdeaRequest):
+    """
+    Streams progress and the verdict for an invention idea as Server-Sent
+    Events.
+    """
+    user_idea = validate_idea(idea_request.idea)
+    await limiter.charge_checks()
+    mode = idea_request.mode or DEFAULT_CHECK_MODE
+    return StreamingResponse(
+        stream_check(user_idea, mode),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class BatchRequest(BaseModel):
+    ideas: list[str]
+    mode: Optional[CheckMode] = None
+
+
+async def stream_batch(ideas: list[str], mode: str):
+    """
+    Checks every idea with at most BATCH_CONCURRENCY graph runs in flight and
+    yields one NDJSON line per idea as soon as it finishes. Concurrent runs
+    share embedding batches and in-flight search calls.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def check_one(index: int, idea: str) -> dict:
+        try:
+            user_idea = validate_idea(idea)
+        except HTTPException as e:
+            return {"index": index, "error": e.detail}
+        async with semaphore:
+            try:
+                result = await run_check(user_idea, mode)
+            except Exception:
+                logging.exception("Batch check failed")
+                return {"index": index, "error": "Something went wrong while checking this idea."}
+        return {"index": index, **result}
+
+    tasks = [asyncio.ensure_future(check_one(i, idea)) for i, idea in enumerate(ideas)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # The client went away; stop the remaining checks.
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/check/batch")
+@limiter.limit(BATCH_RATE_LIMIT)
+async def check_batch(request: Request, batch_request: BatchRequest):
+    """
+    Checks a list of ideas and streams the results as NDJSON, one line per
+    idea in completion order. Each line carries the idea's `index` in the
+    request.
+    """
+    if not batch_request.ideas:
+        raise HTTPException(status_code=400, detail="Ideas cannot be empty.")
+    if len(batch_request.ideas) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"A batch can contain at most {MAX_BATCH_SIZE} ideas.")
+    await limiter.charge_client(
+        request, "batch_ideas", BATCH_IDEA_LIMIT, cost=len(batch_request.ideas))
+    await limiter.charge_checks(len(batch_request.ideas))
+
+    mode = batch_request.mode or DEFAULT_CHECK_MODE
+    return StreamingResponse(
+        stream_batch(batch_request.ideas, mode),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.post("/jobs", status_code=202)
+@limiter.limit("5/minute")
+async def create_job(request: Request, idea_request: IdeaRequest):
+    """
+    Queues an invention idea for checking and returns its job id right away.
+    Poll GET /jobs/{job_id} for the result.
+    """
+    user_idea = validate_idea(idea_request.idea)
+    await limiter.charge_checks()
+    mode = idea_request.mode or DEFAULT_CHECK_MODE
+    job_id = await request.app.state.jobs.submit(user_idea, mode)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """
+    Returns the status of a queued check and, once finished, its result.
+    """
+    job = await asyncio.to_thread(request.app.state.jobs.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
 
 @app.get("/")
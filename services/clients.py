@@ -0,0 +1,103 @@
+import httpx
+import logging
+import os
+
+# Connection pool settings shared by every upstream. Each upstream host gets
+# its own pool, so these are per-host limits; they can be overridden per host
+# with e.g. PATENTSVIEW_MAX_CONNECTIONS.
+HTTP2_ENABLED = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+
+UPSTREAMS = ("openai", "patentsview", "semantic_scholar", "tavily")
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logging.warning(
+            "UPSTREAM_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1.")
+        return False
+    return True
+
+
+def _make_http_client(name: str) -> httpx.AsyncClient:
+    prefix = name.upper()
+    limits = httpx.Limits(
+        max_connections=int(os.getenv(f"{prefix}_MAX_CONNECTIONS", MAX_CONNECTIONS)),
+        max_keepalive_connections=int(
+            os.getenv(f"{prefix}_MAX_KEEPALIVE_CONNECTIONS", MAX_KEEPALIVE_CONNECTIONS)),
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(20.0, pool=POOL_TIMEOUT)
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=_http2_available())
+
+
+class UpstreamClients:
+    """
+    Application-scoped, pooled clients for every upstream service. One
+    instance is created in the FastAPI lifespan hook and shared by all
+    requests so connections (and TLS sessions) are kept alive between calls.
+    """
+
+    def __init__(self):
+        self.patentsview = _make_http_client("patentsview")
+        self.semantic_scholar = _make_http_client("semantic_scholar")
+        self.tavily = _make_http_client("tavily")
+        self._openai_http = _make_http_client("openai")
+        self._openai = None
+
+    @property
+    def openai(self):
+        """
+        The OpenAI SDK client, created on first use because the SDK is slow
+        to import.
+        """
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            # Retries are handled by services.resilience, with the other upstreams.
+            self._openai = AsyncOpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                http_client=self._openai_http,
+                max_retries=0,
+            )
+        return self._openai
+
+    async def aclose(self):
+        if self._openai is not None:
+            await self._openai.close()
+        for client in (self.patentsview, self.semantic_scholar, self.tavily, self._openai_http):
+            await client.aclose()
+
+
+_clients = None
+
+
+def init_clients() -> UpstreamClients:
+    """
+    Creates the shared clients. Called once from the application lifespan.
+    """
+    global _clients
+    if _clients is None:
+        _clients = UpstreamClients()
+    return _clients
+
+
+def get_clients() -> UpstreamClients:
+    """
+    Returns the shared clients, creating them on first use when running
+    outside the FastAPI app (scripts, notebooks).
+    """
+    return _clients if _clients is not None else init_clients()
+
+
+async def close_clients():
+    global _clients
+    if _clients is not None:
+        await _clients.aclose()
+        _clients = None
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+from utils.vectors import EMBEDDING_DTYPE, to_embedding
+from .sqlite_store import connect_cache_db
+
+MAX_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+MAX_DISK_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "200000"))
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+
+# Pruning the disk store scans the table, so only check the size limit every
+# few hundred inserts.
+_PRUNE_EVERY = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing so trivially different copies of the same
+    abstract (whitespace, Unicode composition) share one cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with a bounded in-memory LRU tier in
+    front of a SQLite store, so vectors survive restarts. Vectors are kept in
+    the compact embedding dtype (float32 or int8) and returned without
+    copying; callers must not modify them.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_MEMORY_ENTRIES,
+                 max_disk_entries=MAX_DISK_ENTRIES, dtype=EMBEDDING_DTYPE):
+        self.dtype = dtype
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        # _lock guards the memory tier and counters, _db_lock the connection
+        # (used from worker threads), so memory hits never wait on disk I/O.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._inserts_since_prune = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        self._db = None
+        if path:
+            try:
+                self._db = connect_cache_db(path, synchronous="NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(
+                    f"Embedding cache disk store unavailable, using memory only: {e}")
+                self._db = None
+
+    async def get_many(self, keys: list[str]) -> list:
+        """
+        Returns the cached vector for each key, or None on a miss. The memory
+        tier is checked on the event loop; keys it misses are looked up on
+        disk in a worker thread.
+        """
+        results = [None] * len(keys)
+        disk_lookup = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    results[i] = vector
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+
+        if disk_lookup and self._db is not None:
+            found = await asyncio.to_thread(self._read_disk, list(disk_lookup))
+            with self._lock:
+                for key, vector in found.items():
+                    self._remember(key, vector)
+                    for i in disk_lookup.pop(key):
+                        self.hits += 1
+                        self.disk_hits += 1
+                        results[i] = vector
+
+        with self._lock:
+            self.misses += sum(len(indices) for indices in disk_lookup.values())
+        return results
+
+    async def put_many(self, items: dict):
+        """
+        Stores vectors keyed by cache key in both tiers. The disk write runs
+        in a worker thread.
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for key, embedding in items.items():
+                vector = to_embedding(embedding, self.dtype)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes(), now))
+        if self._db is not None:
+            await asyncio.to_thread(self._write_disk, rows)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _write_disk(self, rows):
+        with self._db_lock:
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to persist embeddings: {e}")
+                return
+            self._inserts_since_prune += len(rows)
+            if self._inserts_since_prune >= _PRUNE_EVERY:
+                self._inserts_since_prune = 0
+                self._prune_disk()
+
+    def _read_disk(self, keys):
+        found = {}
+        with self._db_lock:
+            try:
+                # Stay below SQLite's default limit on bound parameters.
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=self.dtype)
+                if found:
+                    now = time.time()
+                    self._db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to read embedding cache: {e}")
+        return found
+
+    def _prune_disk(self):
+        try:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            excess = count - self.max_disk_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._db.commit()
+                self.disk_evictions += excess
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to prune embedding cache: {e}")
+
+
+_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
@@ -1,16 +1,205 @@
-from openai import AsyncOpenAI
+import asyncio
+import logging
 import os
 
+import httpx
 
-async def get_embedding(text: str, model="text-embedding-3-small"):
+from .clients import get_clients
+from .embedding_cache import cache_key, get_embedding_cache
+from utils.deadline import run_with_deadline
+from utils.vectors import EMBEDDING_DTYPE, to_embedding
+from .resilience import UpstreamError, get_upstream
+from utils.metrics import EMBEDDING_FAILURES
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Shortened embeddings (text-embedding-3 models only), e.g. 512 instead of
+# 1536. 0 keeps the model's full size.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+# OpenAI accepts up to 2048 inputs and ~300k tokens per embeddings request,
+# and at most 8191 tokens per input. Stay comfortably below those limits.
+MAX_BATCH_INPUTS = int(os.getenv("EMBEDDING_MAX_BATCH_INPUTS", "256"))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "200000"))
+MAX_INPUT_TOKENS = 8000
+
+# How long the batcher waits for more texts before sending a request. Calls
+# made by the idea embedding and the three search services within this window
+# share one embeddings.create round trip.
+BATCH_WINDOW_SECONDS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "15")) / 1000
+
+def embedding_space(model=EMBEDDING_MODEL) -> str:
     """
-    Generates an embedding for a given text using OpenAI's async API.
+    Names the vectors produced by the current settings (model, dimensions
+    and dtype), so caches never mix vectors that cannot be compared.
     """
-    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    space = model
+    if EMBEDDING_DIMENSIONS:
+        space += f"/{EMBEDDING_DIMENSIONS}"
+    if EMBEDDING_DTYPE != "float32":
+        space += f"/{EMBEDDING_DTYPE}"
+    return space
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for batch sizing.
+    """
+    return len(text) // 4 + 1
+
+
+def _prepare(text: str) -> str:
     text = text.replace("\n", " ")
-    try:
-        response = await client.embeddings.create(input=[text], model=model)
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"An error occurred while generating embedding: {e}")
-        return None
+    max_chars = MAX_INPUT_TOKENS * 4
+    if len(text) > max_chars:
+        text = text[:max_chars]
+    return text
+
+
+def split_batches(texts, max_inputs=MAX_BATCH_INPUTS, max_tokens=MAX_BATCH_TOKENS):
+    """
+    Splits texts into batches bounded by input count and estimated tokens.
+    Returns a list of batches, each a list of indices into `texts`.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests made within a short window into as few
+    multi-input `embeddings.create` calls as possible, and resolves each
+    caller with its own vector.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL, window=BATCH_WINDOW_SECONDS):
+        self.model = model
+        self.window = window
+        self._pending = []
+        self._flush_task = None
+        self._send_tasks = set()
+
+    async def embed(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((_prepare(text), future))
+
+        if len(self._pending) >= MAX_BATCH_INPUTS:
+            self._flush_now()
+        elif self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        texts = [text for text, _ in pending]
+        for batch in split_batches(texts):
+            task = asyncio.ensure_future(
+                self._send([pending[i] for i in batch]))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, items):
+        texts = [text for text, _ in items]
+        params = {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
+        # Imported here so importing this module doesn't load the SDK.
+        import openai
+
+        try:
+            # Vectors come back base64-encoded and are decoded straight into
+            # arrays, never as lists of Python floats.
+            response = await get_upstream("openai_embeddings").request(
+                lambda: get_clients().openai.embeddings.create(
+                    input=texts, model=self.model, encoding_format="base64", **params))
+            vectors = [None] * len(items)
+            for data in response.data:
+                vectors[data.index] = to_embedding(data.embedding)
+        except (UpstreamError, openai.OpenAIError, httpx.HTTPError):
+            logging.exception(f"Embeddings request for {len(items)} texts failed")
+            EMBEDDING_FAILURES.labels(self.model).inc(len(items))
+            vectors = [None] * len(items)
+        except Exception as e:
+            # Anything else is a bug: fail the callers rather than leave them
+            # waiting for a result.
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(items, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+_batchers = {}
+
+
+def _get_batcher(model: str) -> EmbeddingBatcher:
+    batcher = _batchers.get(model)
+    if batcher is None:
+        batcher = _batchers[model] = EmbeddingBatcher(model)
+    return batcher
+
+
+async def get_embedding(text: str, model=EMBEDDING_MODEL, deadline=None):
+    """
+    Generates an embedding for a given text using OpenAI's async API.
+    Cached vectors are reused and concurrent calls are batched into shared
+    requests.
+    """
+    return (await get_embeddings([text], model=model, deadline=deadline))[0]
+
+
+async def get_embeddings(texts: list[str], model=EMBEDDING_MODEL, deadline=None):
+    """
+    Generates embeddings for several texts, returning compact vectors (see
+    utils.vectors) in the same order as `texts` (None for any text that
+    failed). Raises
+    DeadlineExceeded if the batch has not come back by `deadline`; the
+    shared request itself keeps running for the other callers.
+    """
+    if not texts:
+        return []
+    cache = get_embedding_cache()
+    space = embedding_space(model)
+    keys = [cache_key(space, text) for text in texts]
+    vectors = await cache.get_many(keys)
+
+    # Identical texts in one call are only embedded once.
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        batcher = _get_batcher(model)
+        fetched = await run_with_deadline(asyncio.gather(
+            *(batcher.embed(texts[indices[0]]) for indices in missing.values())), deadline)
+        new_entries = {}
+        for (key, indices), vector in zip(missing.items(), fetched):
+            for i in indices:
+                vectors[i] = vector
+            if vector is not None:
+                new_entries[key] = vector
+        await cache.put_many(new_entries)
+    return vectors
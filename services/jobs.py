@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOBS_PATH = os.getenv("JOBS_DB_PATH", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# A running job whose lease expires (its worker died or restarted) is picked
+# up again by any worker, in this or another process.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often idle workers look for jobs submitted by other processes.
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+
+
+class JobStore:
+    """
+    SQLite-backed job table. Every state change is a single statement or an
+    IMMEDIATE transaction, so several processes can share one database file.
+    """
+
+    def __init__(self, path=JOBS_PATH):
+        if path and path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            path or ":memory:", check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, idea TEXT NOT NULL, mode TEXT NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker_id TEXT, lease_until REAL, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+
+    def create(self, idea: str, mode: str) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, idea, mode, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, idea, mode, time.time()),
+            )
+        return job_id
+
+    def claim(self, worker_id: str):
+        """
+        Atomically takes the oldest queued job, or a running job whose lease
+        has expired. Returns (id, idea, mode) or None.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, idea, mode, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                job_id, idea, mode, attempts = row
+                if attempts >= JOB_MAX_ATTEMPTS:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        ("Job was interrupted too many times.", now, job_id),
+                    )
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_id = ?, "
+                    "lease_until = ?, started_at = ? WHERE id = ?",
+                    (worker_id, now + JOB_LEASE_SECONDS, now, job_id),
+                )
+                self._db.execute("COMMIT")
+                return job_id, idea, mode
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, worker_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job_id, worker_id),
+            )
+
+    def finish(self, job_id: str, worker_id: str, result=None, error=None):
+        status = "failed" if error is not None else "succeeded"
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker_id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 time.time(), job_id, worker_id),
+            )
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, result, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "status": row[1],
+            "created_at": row[4],
+            "started_at": row[5],
+            "finished_at": row[6],
+        }
+        if row[2] is not None:
+            job["result"] = json.loads(row[2])
+        if row[3] is not None:
+            job["error"] = row[3]
+        return job
+
+
+class JobWorkerPool:
+    """
+    A bounded pool of asyncio workers that pull jobs from a JobStore and run
+    them with `run(idea, mode)`.
+    """
+
+    def __init__(self, store: JobStore, run, workers=JOB_WORKERS):
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        for i in range(self.workers):
+            worker_id = f"{os.getpid()}-{i}-{uuid.uuid4().hex[:8]}"
+            self._tasks.append(asyncio.create_task(self._work(worker_id)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, idea: str, mode: str) -> str:
+        job_id = await asyncio.to_thread(self.store.create, idea, mode)
+        self._wakeup.set()
+        return job_id
+
+    async def _work(self, worker_id: str):
+        while True:
+            # Clear before claiming so a submit that lands in between still
+            # wakes this worker.
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim, worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, idea, mode = job
+            heartbeat = asyncio.create_task(self._renew_lease(job_id, worker_id))
+            try:
+                result = await self.run(idea, mode)
+            except asyncio.CancelledError:
+                # Shutting down; the lease expires and another worker retries.
+                raise
+            except Exception:
+                logging.exception(f"Job {job_id} failed")
+                await asyncio.to_thread(
+                    self.store.finish, job_id, worker_id,
+                    error="Something went wrong while checking this idea.")
+            else:
+                await asyncio.to_thread(self.store.finish, job_id, worker_id, result=result)
+            finally:
+                heartbeat.cancel()
+
+    async def _renew_lease(self, job_id: str, worker_id: str):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.store.renew, job_id, worker_id)
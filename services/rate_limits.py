@@ -0,0 +1,290 @@
+import asyncio
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+# Where rate-limit counters live. All workers and replicas pointing at the
+# same store share their limits:
+#   sqlite:///path/to/file  one file shared by the workers on a host (default)
+#   redis://host:6379/0     Redis or any server speaking its protocol
+#   memory://               this process only
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "sqlite:///.cache/rate_limits.sqlite3")
+# Checks accepted across all clients, e.g. "1000/hour"; bounds the model and
+# search spend. Empty for no global limit.
+CHECK_BUDGET = os.getenv("CHECK_BUDGET", "")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_SPEC = re.compile(
+    r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$", re.IGNORECASE)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def parse_limit(spec: str):
+    """
+    Parses a limit such as "5/minute", "100 per hour" or "10/30 seconds"
+    into (count, window seconds).
+    """
+    match = _LIMIT_SPEC.match(spec or "")
+    if match is None:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    count, periods, unit = match.groups()
+    return int(count), int(periods or 1) * _PERIODS[unit.lower()]
+
+
+def _retry_after(limit, cost, current, previous, elapsed, window) -> float:
+    """
+    Seconds until `cost` more hits fit, given the counts of the current and
+    previous fixed windows and the time elapsed in the current one.
+    """
+    room = limit - current - cost
+    if room < 0 or previous == 0:
+        # Only the next window can make room.
+        return window - elapsed
+    # The previous window's weight has to fall to room / previous.
+    return max(0.0, window * (1 - room / previous) - elapsed)
+
+
+class RateLimitStore:
+    """
+    Sliding-window counters: each key keeps a count for the current and the
+    previous fixed window, and the previous one is weighted by how much of
+    it still overlaps the sliding window. Subclasses implement `_hit`, which
+    must check and increment atomically.
+    """
+
+    def hit(self, key: str, limit: int, window: float, cost: int = 1) -> float:
+        """
+        Records `cost` hits against `key` if they fit in `limit` per
+        `window` seconds. Returns 0 when they were recorded, otherwise the
+        seconds to wait before they would fit.
+        """
+        now = time.time()
+        index = int(now // window)
+        elapsed = now - index * window
+        weight = 1 - elapsed / window
+        allowed, current, previous = self._hit(key, index, limit, weight, cost, window)
+        if allowed:
+            return 0.0
+        return _retry_after(limit, cost, current, previous, elapsed, window)
+
+    def _hit(self, key, index, limit, weight, cost, window):
+        """Returns (allowed, current count, previous count)."""
+        raise NotImplementedError
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _hit(self, key, index, limit, weight, cost, window):
+        with self._lock:
+            windows = self._counts.get(key)
+            if windows is None or windows[0] < index - 1:
+                windows = [index, 0, 0]
+            elif windows[0] == index - 1:
+                windows = [index, windows[2], 0]
+            _, previous, current = windows
+            allowed = previous * weight + current + cost <= limit
+            if allowed:
+                windows[2] += cost
+            self._counts[key] = windows
+            return allowed, current, previous
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Counters in a SQLite file. Each hit is one IMMEDIATE transaction, so the
+    workers on a host can share one file.
+    """
+
+    def __init__(self, path: str):
+        if path and path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            path or ":memory:", check_same_thread=False, isolation_level=None, timeout=5)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT NOT NULL, window INTEGER NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (key, window))"
+        )
+
+    def _hit(self, key, index, limit, weight, cost, window):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                counts = dict(self._db.execute(
+                    "SELECT window, count FROM rate_limits WHERE key = ? AND window >= ?",
+                    (key, index - 1),
+                ).fetchall())
+                previous = counts.get(index - 1, 0)
+                current = counts.get(index, 0)
+                allowed = previous * weight + current + cost <= limit
+                if allowed:
+                    self._db.execute(
+                        "INSERT INTO rate_limits (key, window, count) VALUES (?, ?, ?) "
+                        "ON CONFLICT (key, window) DO UPDATE SET count = count + excluded.count",
+                        (key, index, cost),
+                    )
+                    self._db.execute(
+                        "DELETE FROM rate_limits WHERE key = ? AND window < ?", (key, index - 1))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return allowed, current, previous
+
+
+# Checks and increments the current window in one round trip. KEYS are the
+# current and previous window counters; ARGV is limit, weight, cost and the
+# counter's time to live in milliseconds.
+_REDIS_HIT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local cost = tonumber(ARGV[3])
+if previous * tonumber(ARGV[2]) + current + cost > tonumber(ARGV[1]) then
+    return {0, current, previous}
+end
+redis.call('INCRBY', KEYS[1], cost)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return {1, current, previous}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Counters in Redis (or a compatible server such as Valkey or KeyDB),
+    shared by every replica. The check and increment run as one Lua script.
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RATE_LIMIT_STORAGE points at Redis but the redis package is not installed") from e
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_HIT)
+
+    def _hit(self, key, index, limit, weight, cost, window):
+        allowed, current, previous = self._script(
+            keys=[f"ratelimit:{key}:{index}", f"ratelimit:{key}:{index - 1}"],
+            # Weights only matter for one more window.
+            args=[limit, repr(weight), cost, int(window * 2000)],
+        )
+        return bool(allowed), int(current), int(previous)
+
+
+def create_store(url: str = RATE_LIMIT_STORAGE) -> RateLimitStore:
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryRateLimitStore()
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path
+        return SQLiteRateLimitStore(url[len("sqlite:///"):])
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_STORAGE: {url!r}")
+
+
+def client_address(request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
+
+
+class RateLimiter:
+    """
+    Per-client limits for endpoints and shared budgets, kept in a store all
+    workers can see. If the store fails, requests are let through.
+    """
+
+    def __init__(self, store: RateLimitStore = None, check_budget: str = CHECK_BUDGET):
+        self._store = store
+        self.check_budget = parse_limit(check_budget) if check_budget else None
+        self.enabled = True
+
+    @property
+    def store(self) -> RateLimitStore:
+        if self._store is None:
+            self._store = create_store()
+        return self._store
+
+    async def hit(self, key: str, limit, cost: int = 1) -> float:
+        """
+        Counts `cost` against `key` under `limit` ((count, seconds) or a
+        spec such as "5/minute"). Returns 0 when allowed, otherwise the
+        seconds to wait.
+        """
+        if not self.enabled:
+            return 0.0
+        count, window = parse_limit(limit) if isinstance(limit, str) else limit
+        try:
+            return await asyncio.to_thread(self.store.hit, key, count, window, cost)
+        except Exception as e:
+            logging.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return 0.0
+
+    def limit(self, spec: str):
+        """
+        Decorates an endpoint that takes `request: Request` so each client
+        address can call it at most `spec` times.
+        """
+        limit = parse_limit(spec)
+
+        def decorator(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                request = kwargs["request"]
+                key = f"{endpoint.__name__}:{client_address(request)}"
+                retry_after = await self.hit(key, limit)
+                if retry_after:
+                    raise RateLimitExceeded(f"Rate limit exceeded: {spec}", retry_after)
+                return await endpoint(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    async def charge_client(self, request, name: str, spec: str, cost: int = 1):
+        """
+        Counts `cost` against the calling client's `spec` budget for `name`
+        (e.g. ideas submitted in batches), raising RateLimitExceeded when it
+        is spent.
+        """
+        retry_after = await self.hit(f"{name}:{client_address(request)}", spec, cost=cost)
+        if retry_after:
+            raise RateLimitExceeded(f"Rate limit exceeded: {spec}", retry_after)
+
+    async def charge_checks(self, count: int = 1):
+        """
+        Counts `count` checks against the global CHECK_BUDGET, raising
+        RateLimitExceeded when it is spent.
+        """
+        if self.check_budget is None:
+            return
+        retry_after = await self.hit("checks", self.check_budget, cost=count)
+        if retry_after:
+            raise RateLimitExceeded("The service is at capacity, please try again later.", retry_after)
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,311 @@
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import os
+import random
+import time
+
+import httpx
+
+from services.rate_limits import get_rate_limiter, parse_limit
+from utils.deadline import DeadlineExceeded, remaining
+from utils.metrics import (
+    UPSTREAM_CIRCUIT_OPEN,
+    UPSTREAM_RATE,
+    UPSTREAM_REJECTED,
+    UPSTREAM_RETRIES,
+    observe_upstream,
+)
+
+# Default client-side rate (requests per second) and burst per upstream.
+# PatentsView allows 45 requests a minute per key and Semantic Scholar one
+# request a second; override with e.g. PATENTSVIEW_RATE_PER_SECOND and
+# PATENTSVIEW_BURST.
+RATE_LIMITS = {
+    "patentsview": (0.75, 4),
+    "semantic_scholar": (1.0, 1),
+    "tavily": (5.0, 10),
+    "openai_embeddings": (50.0, 50),
+}
+# Calls allowed per upstream across every worker sharing the rate-limit store
+# (see services.rate_limits), on top of each process's token bucket. Override
+# with e.g. PATENTSVIEW_BUDGET="45/minute"; an empty value removes the budget.
+UPSTREAM_BUDGETS = {
+    "patentsview": "45/minute",
+    "semantic_scholar": "60/minute",
+}
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+RETRY_BASE_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "8"))
+# Consecutive failures (5xx, timeouts, connection errors) that open the
+# circuit, and how long it stays open before a trial request is let through.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("UPSTREAM_CIRCUIT_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """
+    An upstream could not answer: it kept failing, rejected the request, or
+    its circuit is open. Search tools report the source as missing instead
+    of treating it as "no results".
+    """
+
+    def __init__(self, upstream: str, reason: str, status=None):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.status = status
+
+
+def parse_retry_after(value):
+    """
+    Returns the delay in seconds from a Retry-After header (seconds or an
+    HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter. Backs off when the upstream answers 429: every
+    caller waits out Retry-After and the rate is halved, then it grows back
+    towards the configured rate with each success.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        UPSTREAM_RATE.labels(name).set(rate)
+
+    async def acquire(self, deadline=None):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                wait = self._paused_until - now
+            else:
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            left = remaining(deadline)
+            if left is not None and wait > left:
+                UPSTREAM_REJECTED.labels(self.name, "rate_limited").inc()
+                raise DeadlineExceeded()
+            await asyncio.sleep(wait)
+
+    def throttle(self, retry_after=None):
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + (retry_after or 1 / self.rate))
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self._updated = now
+        UPSTREAM_RATE.labels(self.name).set(self.rate)
+
+    def recover(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            UPSTREAM_RATE.labels(self.name).set(self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive failures so calls fail
+    fast instead of waiting on a dead upstream. After CIRCUIT_RESET_SECONDS
+    one trial call is let through; it closes the circuit again on success.
+    """
+
+    def __init__(self, name: str, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raises UpstreamError while the circuit is open. Returns True when
+        this call is the half-open trial.
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        UPSTREAM_REJECTED.labels(self.name, "circuit_open").inc()
+        raise UpstreamError(self.name, "circuit open")
+
+    def end_probe(self):
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        if self.opened_at is not None:
+            logging.info(f"Circuit for {self.name} closed")
+            self.opened_at = None
+            UPSTREAM_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logging.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            UPSTREAM_CIRCUIT_OPEN.labels(self.name).set(1)
+
+
+def _classify(outcome):
+    """
+    Returns (status, retry_after) for a response or a failed call. A status
+    of None means a network-level failure; SDK results count as a 200.
+    """
+    if not isinstance(outcome, (Exception, httpx.Response)):
+        return 200, None
+    response = outcome if isinstance(outcome, httpx.Response) else getattr(outcome, "response", None)
+    if isinstance(response, httpx.Response):
+        return response.status_code, parse_retry_after(response.headers.get("retry-after"))
+    return None, None
+
+
+class Upstream:
+    """
+    Shared rate limiter, retry policy and circuit breaker for one upstream.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, budget: str = "",
+                 max_retries=MAX_RETRIES):
+        self.name = name
+        self.bucket = TokenBucket(name, rate, burst)
+        self.breaker = CircuitBreaker(name)
+        self.budget = parse_limit(budget) if budget else None
+        self.max_retries = max_retries
+
+    async def spend_budget(self, deadline=None):
+        """
+        Takes one call from the shared budget, waiting for room until the
+        deadline (or RETRY_MAX_SECONDS without one). Raises UpstreamError
+        when the budget stays spent.
+        """
+        if self.budget is None:
+            return
+        while True:
+            wait = await get_rate_limiter().hit(f"upstream:{self.name}", self.budget)
+            if not wait:
+                return
+            left = remaining(deadline)
+            if wait > (RETRY_MAX_SECONDS if left is None else left):
+                UPSTREAM_REJECTED.labels(self.name, "budget").inc()
+                raise UpstreamError(self.name, "shared budget exhausted")
+            await asyncio.sleep(wait)
+
+    async def request(self, send, deadline=None):
+        """
+        Calls `send()` (an httpx request, or an OpenAI SDK call) with rate
+        limiting and the shared budget, jittered retries on 429, 5xx and network errors, and the
+        circuit breaker. Returns the successful result; raises UpstreamError
+        once the call has failed for good and DeadlineExceeded when there
+        is no time left to wait or retry.
+        """
+        # Imported here rather than at module level: the SDK is slow to
+        # import and isn't needed until the first call.
+        import openai
+
+        for attempt in range(self.max_retries + 1):
+            probe = self.breaker.before_call()
+            try:
+                await self.bucket.acquire(deadline)
+                await self.spend_budget(deadline)
+                with observe_upstream(self.name) as call:
+                    try:
+                        outcome = await send()
+                    except (httpx.TransportError, openai.APIConnectionError) as e:
+                        outcome = e
+                    except (httpx.HTTPStatusError, openai.APIStatusError) as e:
+                        outcome = e
+                    status, retry_after = _classify(outcome)
+                    if isinstance(outcome, Exception):
+                        call.outcome = "error" if status is None else str(status)
+                    elif status is not None and status >= 400:
+                        call.outcome = str(status)
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+
+            if status is not None and status < 400:
+                self.breaker.record_success()
+                self.bucket.recover()
+                return outcome
+            if status == 429:
+                self.bucket.throttle(retry_after)
+            elif status is None or status >= 500:
+                self.breaker.record_failure()
+            else:
+                # Other 4xx responses won't succeed on retry.
+                self.breaker.record_success()
+                raise UpstreamError(self.name, f"HTTP {status}", status=status)
+
+            reason = f"HTTP {status}" if status is not None else f"{type(outcome).__name__}: {outcome}"
+            if status not in RETRYABLE_STATUSES and status is not None:
+                raise UpstreamError(self.name, reason, status=status)
+            if attempt == self.max_retries or self.breaker.state == "open":
+                raise UpstreamError(self.name, reason, status=status)
+
+            # Full jitter, but never sooner than the upstream asked for.
+            delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            left = remaining(deadline)
+            if left is not None and delay >= left:
+                raise DeadlineExceeded()
+            logging.info(f"Retrying {self.name} in {delay:.2f}s after {reason}")
+            UPSTREAM_RETRIES.labels(self.name).inc()
+            await asyncio.sleep(delay)
+
+
+_upstreams = {}
+
+
+def get_upstream(name: str) -> Upstream:
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        rate, burst = RATE_LIMITS.get(name, (10.0, 10))
+        prefix = name.upper()
+        upstream = _upstreams[name] = Upstream(
+            name,
+            rate=float(os.getenv(f"{prefix}_RATE_PER_SECOND", rate)),
+            burst=float(os.getenv(f"{prefix}_BURST", burst)),
+            budget=os.getenv(f"{prefix}_BUDGET", UPSTREAM_BUDGETS.get(name, "")),
+        )
+    return upstream
@@ -0,0 +1,227 @@
+from collections import OrderedDict
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from .sqlite_store import connect_cache_db
+
+# Per-source time to live. Patents and papers change slowly; web results
+# go stale faster.
+TTL_SECONDS = {
+    "patents": float(os.getenv("SEARCH_CACHE_TTL_PATENTS", str(24 * 3600))),
+    "scholar": float(os.getenv("SEARCH_CACHE_TTL_SCHOLAR", str(24 * 3600))),
+    "web": float(os.getenv("SEARCH_CACHE_TTL_WEB", "3600")),
+}
+DEFAULT_TTL_SECONDS = 3600
+MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+# Persistence is optional; leave empty to keep the cache in memory only.
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+# JSON keys marking encoded embedding arrays in persisted results.
+_ARRAY_TAGS = {"__f32__": np.dtype("<f4"), "__i8__": np.dtype(np.int8)}
+_DTYPE_TAGS = {dtype: tag for tag, dtype in _ARRAY_TAGS.items()}
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercases the query and reduces it to its word tokens, so punctuation
+    and spacing differences hit the same entry.
+    """
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+def _encode_array(value):
+    """
+    json.dumps hook that stores result embeddings as base64 bytes of their
+    compact dtype instead of lists of floats.
+    """
+    if isinstance(value, np.ndarray):
+        tag = _DTYPE_TAGS.get(value.dtype, "__f32__")
+        data = np.ascontiguousarray(value, dtype=_ARRAY_TAGS[tag]).tobytes()
+        return {tag: base64.b64encode(data).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_array(obj: dict):
+    if len(obj) == 1:
+        ((tag, data),) = obj.items()
+        if tag in _ARRAY_TAGS:
+            return np.frombuffer(base64.b64decode(data), dtype=_ARRAY_TAGS[tag])
+    return obj
+
+
+class SearchCache:
+    """
+    TTL cache of upstream search responses keyed by source and normalized
+    query. Values are the already-embedded results returned by the search
+    services, so a hit skips both the upstream call and the embedding step.
+    Concurrent misses for the same key share a single upstream call.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttls=None):
+        self.max_entries = max_entries
+        self.ttls = ttls or TTL_SECONDS
+        self._memory = OrderedDict()
+        self._inflight = {}
+        # _lock guards the memory tier and counters, _db_lock the connection
+        # (used from worker threads), so memory hits never wait on disk I/O.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if path:
+            try:
+                self._db = connect_cache_db(path)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS search_results ("
+                    "key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(
+                    f"Search cache disk store unavailable, using memory only: {e}")
+                self._db = None
+
+    def key(self, source: str, query: str, **params) -> str:
+        suffix = ",".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{source}:{suffix}:{normalize_query(query)}"
+
+    async def get(self, key: str):
+        """
+        Returns the live cached results for `key`, or None. The memory tier
+        is checked on the event loop and the disk store in a worker thread.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, results = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return list(results)
+                del self._memory[key]
+
+        row = None
+        if self._db is not None:
+            row = await asyncio.to_thread(self._read_disk, key, now)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            expires_at, results = row
+            self._remember(key, expires_at, results)
+            self.hits += 1
+            return list(results)
+
+    async def put(self, key: str, source: str, results: list):
+        expires_at = time.time() + self.ttls.get(source, DEFAULT_TTL_SECONDS)
+        with self._lock:
+            self._remember(key, expires_at, results)
+        if self._db is not None:
+            await asyncio.to_thread(self._write_disk, key, expires_at, results)
+
+    def _read_disk(self, key, now):
+        with self._db_lock:
+            try:
+                row = self._db.execute(
+                    "SELECT results, expires_at FROM search_results WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to read search cache: {e}")
+                return None
+        if row is None:
+            return None
+        return row[1], json.loads(row[0], object_hook=_decode_array)
+
+    def _write_disk(self, key, expires_at, results):
+        try:
+            payload = json.dumps(results, default=_encode_array)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Failed to persist search results: {e}")
+            return
+        with self._db_lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_results (key, results, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, expires_at),
+                )
+                self._db.execute(
+                    "DELETE FROM search_results WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to persist search results: {e}")
+
+    async def cached(self, source: str, query: str, fetch, **params):
+        """
+        Returns cached results for `query` from `source`, or awaits `fetch()`
+        and caches its result when it is non-empty and fully embedded.
+        """
+        key = self.key(source, query, **params)
+        results = await self.get(key)
+        if results is not None:
+            return results
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            await asyncio.wait({inflight})
+            # If the leading call was cancelled, fetch independently.
+            if not inflight.cancelled():
+                return list(inflight.result())
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await fetch()
+            # Empty results usually mean the upstream failed, and results
+            # without embeddings mean the embeddings call did; don't pin either.
+            if results and all(r.get("embedding") is not None for r in results):
+                await self.put(key, source, results)
+            future.set_result(results)
+            return results
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key, expires_at, results):
+        self._memory[key] = (expires_at, results)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+
+_cache = None
+
+
+def get_search_cache() -> SearchCache:
+    global _cache
+    if _cache is None:
+        _cache = SearchCache()
+    return _cache
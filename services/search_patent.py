@@ -1,7 +1,11 @@
-import httpx
 import asyncio
 import json
-from .embeddings import get_embedding
+from .clients import get_clients
+from .embeddings import get_embeddings
+from utils.deadline import DeadlineExceeded, expired, remaining, request_timeout
+from utils.metrics import PATENT_STRATEGY_CALLS, PATENT_STRATEGY_LATENCY
+from utils.retrieval import STOP_WORDS, candidate_pool, select_candidates
+from .resilience import UpstreamError, get_upstream
 import logging
 import os
 
@@ -9,25 +13,139 @@ import os
 logging.basicConfig(level=logging.WARNING)
 
 
-async def search_patent(query: str, num_results=5, state=None):
+PATENTSVIEW_API_URL = os.getenv(
+    "PATENTSVIEW_API_URL", "https://search.patentsview.org/api/v1/patent/")
+
+# Most patents PatentsView returns per request.
+MAX_PAGE_SIZE = 1000
+
+# Strategies are launched this far apart (0 sends them all at once); a
+# strategy that comes back empty or fails launches the next one at once. The
+# default is about the primary strategy's median latency, so most checks
+# make a single PatentsView call against its 45/minute quota, at the cost of
+# up to one delay of extra latency when the primary finds nothing. Tune it
+# from the p50 of doesitexist_patent_strategy_duration_seconds.
+HEDGE_DELAY_SECONDS = float(os.getenv("PATENT_HEDGE_DELAY_MS", "500")) / 1000
+
+def _record_strategy(name, outcome, elapsed):
+    PATENT_STRATEGY_CALLS.labels(name, outcome).inc()
+    PATENT_STRATEGY_LATENCY.labels(name, outcome).observe(elapsed)
+
+
+async def race_strategies(strategies, run_strategy, hedge_delay=None, deadline=None):
+    """
+    Runs (name, query) strategies concurrently, the k-th one starting
+    k * hedge_delay seconds in (or as soon as every earlier one came back
+    empty). Returns the results of the highest-ranked strategy with a
+    non-empty answer, cancelling any strategy that can no longer win. If the
+    deadline passes first, the best answer received so far is returned. If
+    every strategy failed, the top-ranked strategy's error is raised.
+    """
+    if hedge_delay is None:
+        hedge_delay = HEDGE_DELAY_SECONDS
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    outcomes = [None] * len(strategies)
+    launched_at = {}
+    finished_at = {}
+    pending = {}
+    errors = {}
+
+    async def timed(i):
+        try:
+            return await run_strategy(strategies[i][1])
+        except Exception as e:
+            logging.warning(f"Strategy {i+1} failed: {e}")
+            errors[i] = e
+            return None
+
+    def launch(i):
+        launched_at[i] = loop.time()
+        pending[asyncio.create_task(timed(i))] = i
+
+    launch(0)
+    try:
+        while True:
+            # The winner is the first strategy with results once every
+            # strategy ranked above it has come back empty.
+            for i, outcome in enumerate(outcomes):
+                if outcome is None:
+                    break
+                if outcome:
+                    _record_strategy(strategies[i][0], "win", finished_at[i] - launched_at[i])
+                    for j in range(i + 1, len(outcomes)):
+                        if outcomes[j]:
+                            _record_strategy(
+                                strategies[j][0], "superseded", finished_at[j] - launched_at[j])
+                    return outcome
+            else:
+                if len(errors) == len(strategies):
+                    raise errors[0]
+                return []
+
+            if expired(deadline):
+                for i, outcome in enumerate(outcomes):
+                    if outcome:
+                        _record_strategy(strategies[i][0], "win", finished_at[i] - launched_at[i])
+                        return outcome
+                return []
+
+            next_index = len(launched_at)
+            if next_index < len(strategies):
+                due = started + next_index * hedge_delay
+                if not pending or loop.time() >= due:
+                    launch(next_index)
+                    continue
+                timeout = due - loop.time()
+            else:
+                timeout = None
+            left = remaining(deadline)
+            if left is not None:
+                timeout = left if timeout is None else min(timeout, left)
+
+            done, _ = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = pending.pop(task)
+                finished_at[i] = loop.time()
+                result = task.result()
+                outcomes[i] = result or []
+                if not result:
+                    _record_strategy(
+                        strategies[i][0], "error" if result is None else "empty",
+                        finished_at[i] - launched_at[i])
+    finally:
+        for task, i in pending.items():
+            task.cancel()
+            _record_strategy(strategies[i][0], "cancelled", loop.time() - launched_at[i])
+
+
+def extract_query_words(query: str) -> list:
+    """
+    Returns the lowercased key terms of a query, without stop words and
+    words of two letters or fewer.
+    """
+    return [word.lower().strip() for word in query.split()
+            if word.lower().strip() not in STOP_WORDS and len(word.strip()) > 2]
+
+
+async def search_patent(query: str, num_results=5, state=None, client=None, deadline=None):
     """
     Searches PatentView for similar patents and returns top results with embeddings.
-    Uses improved search strategy with multiple approaches and relevance sorting.
+    Uses improved search strategy with multiple approaches, then ranks a wide
+    candidate pool with BM25 and embeds only the best `num_results`.
+    Upstream calls are cut short at `deadline` (a monotonic timestamp).
     """
     if state is None:
         state = {}
+    if client is None:
+        client = get_clients().patentsview
     invocation_count = state.get('tool_invocation_count', {})
 
-    url = "https://search.patentsview.org/api/v1/patent/"
+    url = PATENTSVIEW_API_URL
 
     # Extract key terms from the query for better searching
-    # Remove common stop words and clean the query
-    stop_words = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
-                  'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the',
-                  'to', 'was', 'will', 'with', 'using', 'device', 'system', 'method'}
-
-    query_words = [word.lower().strip() for word in query.split()
-                   if word.lower().strip() not in stop_words and len(word.strip()) > 2]
+    query_words = extract_query_words(query)
 
     # Create a multi-strategy search query
     # Strategy 1: Phrase search for the most important terms
@@ -39,41 +157,41 @@ async def search_patent(query: str, num_results=5, state=None):
     # Strategy 1: If we have 2-4 key words, try phrase search
     if 2 <= len(query_words) <= 4:
         key_phrase = " ".join(query_words[:3])  # Use first 3 words as phrase
-        search_strategies.append({
+        search_strategies.append(("phrase", {
             "_or": [
                 {"_text_phrase": {"patent_title": key_phrase}},
                 {"_text_phrase": {"patent_abstract": key_phrase}}
             ]
-        })
+        }))
 
     # Strategy 2: All key words must be present
     if len(query_words) >= 2:
         key_terms = " ".join(query_words[:5])  # Use up to 5 key words
-        search_strategies.append({
+        search_strategies.append(("all_words", {
             "_or": [
                 {"_text_all": {"patent_title": key_terms}},
                 {"_text_all": {"patent_abstract": key_terms}}
             ]
-        })
+        }))
 
     # Strategy 3: Any of the key words (but require at least 2 matches for better relevance)
     if len(query_words) >= 3:
         important_terms = " ".join(query_words[:6])  # Use up to 6 terms
-        search_strategies.append({
+        search_strategies.append(("any_words", {
             "_or": [
                 {"_text_any": {"patent_title": important_terms}},
                 {"_text_any": {"patent_abstract": important_terms}}
             ]
-        })
+        }))
 
     # Fallback: If no strategies work, use the original query
     if not search_strategies:
-        search_strategies.append({
+        search_strategies.append(("fallback", {
             "_or": [
                 {"_text_any": {"patent_title": query}},
                 {"_text_any": {"patent_abstract": query}}
             ]
-        })
+        }))
 
     # Fields to retrieve - using correct field names per official API documentation
     f = [
@@ -82,118 +200,71 @@ async def search_patent(query: str, num_results=5, state=None):
         "patent_abstract",
         "patent_date",
         "inventors",
-        "patent_num_times_cited_by_us_patents"  # For relevance scoring
+        "patent_num_times_cited_by_us_patents"  # Used to sort the candidates
     ]
 
-    # Try each strategy in order of preference
-    results = []
     headers = {
         "X-Api-Key": os.getenv("PATENTSVIEW_API_KEY")
     }
 
-    for i, q_strategy in enumerate(search_strategies):
-        try:
-            # Sort by citation count (more cited = more relevant) and recent date
-            s = [
-                {"patent_num_times_cited_by_us_patents": "desc"},
-                {"patent_date": "desc"}
-            ]
+    async def run_strategy(q_strategy):
+        # Sort by citation count (more cited = more relevant) and recent date
+        s = [
+            {"patent_num_times_cited_by_us_patents": "desc"},
+            {"patent_date": "desc"}
+        ]
+
+        # Fetch a wide candidate pool; only the best few are embedded.
+        o = {"size": candidate_pool(MAX_PAGE_SIZE, num_results)}
+
+        # Parameters for the POST request
+        params = {
+            "q": q_strategy,
+            "f": f,
+            "s": s,
+            "o": o
+        }
 
-            # Options for the query - get more results to filter better ones
-            # Get 3x results to filter best ones
-            o = {"size": min(num_results * 3, 50)}
-
-            # Parameters for the POST request
-            params = {
-                "q": q_strategy,
-                "f": f,
-                "s": s,
-                "o": o
-            }
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=params, headers=headers, timeout=20.0)
-                response.raise_for_status()
-
-            data = response.json()
-            strategy_results = data.get("patents", [])
-
-            if strategy_results:
-                # Remove info logs for strategy results
-                # logging.info(f"Strategy {i+1} found {len(strategy_results)} results")
-                # logging.info(f"Strategy {i+1} returned no results")
-                results = strategy_results
-                break  # Use the first strategy that returns results
-            else:
-                # Remove info logs for strategy results
-                # logging.info(f"Strategy {i+1} returned no results")
-                continue
+        response = await get_upstream("patentsview").request(
+            lambda: client.post(url, json=params, headers=headers, timeout=request_timeout(deadline)),
+            deadline)
+        return response.json().get("patents", [])
 
-        except Exception as e:
-            logging.warning(f"Strategy {i+1} failed: {e}")
-            continue
+    # Run the strategies speculatively; the most preferred one that returns
+    # results wins.
+    try:
+        results = await race_strategies(search_strategies, run_strategy, deadline=deadline)
+    except (UpstreamError, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise UpstreamError("patentsview", str(e)) from e
 
     if not results:
         logging.warning("All search strategies failed or returned no results")
         return []
 
-    # Filter and rank results based on relevance
-    def calculate_relevance_score(patent):
-        """Calculate a simple relevance score based on query terms in title/abstract"""
-        title = (patent.get('patent_title') or '').lower()
-        abstract = (patent.get('patent_abstract') or '').lower()
-
-        # Count query word matches
-        title_matches = sum(1 for word in query_words if word in title)
-        abstract_matches = sum(1 for word in query_words if word in abstract)
-
-        # Weight title matches higher than abstract matches
-        score = (title_matches * 3) + (abstract_matches * 1)
-
-        # Bonus for citation count (popular patents are more likely to be relevant)
-        citations = patent.get('patent_num_times_cited_by_us_patents') or 0
-        if isinstance(citations, (int, float)) and citations > 0:
-            score += min(citations / 10, 5)  # Cap bonus at 5 points
-
-        return score
-
-    # Score and sort results
-    scored_results = [(calculate_relevance_score(p), p) for p in results]
-    scored_results.sort(key=lambda x: x[0], reverse=True)
-
-    # Take the best results
-    best_results = [p for score,
-                    p in scored_results[:num_results] if score > 0]
-
-    # If we don't have enough good results, take the top ones anyway
-    if len(best_results) < num_results:
-        best_results = [p for score, p in scored_results[:num_results]]
-
-    async def format_and_embed(item):
+    def format_result(item):
         title = item.get('patent_title', 'No Title')
         snippet = item.get('patent_abstract', 'No Snippet')
         patent_id = item.get('patent_id', '')  # Using correct field name
         link = f"https://patents.google.com/patent/US{patent_id}/en" if patent_id else ""
 
-        text_to_embed = f"{title} {snippet}"
-        embedding = await get_embedding(text_to_embed)
-
         return {
             "title": title,
             "snippet": snippet,
             "link": link,
-            "embedding": embedding
         }
 
     try:
-        embedded_results = await asyncio.gather(*(format_and_embed(p) for p in best_results))
-        return embedded_results
-    except httpx.HTTPStatusError as e:
-        logging.error("An HTTP error occurred while searching PatentView.")
-        logging.error(f"Status code: {e.response.status_code}")
-        logging.error(f"Response body: {e.response.text}")
-        logging.error(f"Response headers: {e.response.headers}")
-        return []
+        formatted_results = select_candidates(
+            query, [format_result(p) for p in results], num_results)
+        embeddings = await get_embeddings(
+            [f"{r['title']} {r['snippet']}" for r in formatted_results], deadline=deadline)
+        for result, embedding in zip(formatted_results, embeddings):
+            result["embedding"] = embedding
+        return formatted_results
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(
             f"An unexpected error occurred while searching PatentView: {e}")
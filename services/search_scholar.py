@@ -1,22 +1,35 @@
-import httpx
-import asyncio
-from .embeddings import get_embedding
+from .clients import get_clients
+from .embeddings import get_embeddings
+from .resilience import UpstreamError, get_upstream
+from utils.deadline import DeadlineExceeded, request_timeout
+from utils.retrieval import candidate_pool, select_candidates
 import logging
 import os
 
+SEMANTIC_SCHOLAR_API_URL = os.getenv(
+    "SEMANTIC_SCHOLAR_API_URL", "https://api.semanticscholar.org/graph/v1")
+# Most papers the search endpoint returns per request.
+MAX_PAGE_SIZE = 100
+
 # Set logging level to WARNING to suppress info logs
 logging.basicConfig(level=logging.WARNING)
 
 
-async def search_scholar(query: str, num_results=5):
+async def search_scholar(query: str, num_results=5, client=None, deadline=None):
     """
     Searches Semantic Scholar for similar papers and returns top results with embeddings.
+    A wide candidate pool is ranked with BM25 and only the best `num_results`
+    are embedded.
+    Upstream calls are cut short at `deadline` (a monotonic timestamp).
     """
-    url = "https://api.semanticscholar.org/graph/v1/paper/search"
+    if client is None:
+        client = get_clients().semantic_scholar
+
+    url = f"{SEMANTIC_SCHOLAR_API_URL}/paper/search"
 
     params = {
         "query": query,
-        "limit": num_results,
+        "limit": candidate_pool(MAX_PAGE_SIZE, num_results),
         "fields": "title,abstract,year,authors,url,citationCount"
     }
 
@@ -25,43 +38,38 @@ async def search_scholar(query: str, num_results=5):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, headers=headers, timeout=20.0)
-            response.raise_for_status()
+        response = await get_upstream("semantic_scholar").request(
+            lambda: client.get(url, params=params, headers=headers, timeout=request_timeout(deadline)),
+            deadline)
 
         data = response.json()
         results = data.get("data", [])
         if not results:
             return []
 
-        async def format_and_embed(item):
-            title = item.get('title', 'No Title')
-            snippet = item.get('abstract', 'No Snippet')
-            link = item.get('url', '')
-
-            text_to_embed = f"{title} {snippet}"
-            embedding = await get_embedding(text_to_embed)
-
+        def format_result(item):
             return {
-                "title": title,
-                "snippet": snippet,
-                "link": link,
+                "title": item.get('title', 'No Title'),
+                "snippet": item.get('abstract', 'No Snippet'),
+                "link": item.get('url', ''),
                 "authors": [author['name'] for author in item.get('authors', [])],
                 "year": item.get('year'),
                 "citationCount": item.get('citationCount'),
-                "embedding": embedding
             }
 
-        embedded_results = await asyncio.gather(*(format_and_embed(p) for p in results))
-        return embedded_results
+        formatted_results = select_candidates(
+            query, [format_result(p) for p in results], num_results)
+        embeddings = await get_embeddings(
+            [f"{r['title']} {r['snippet']}" for r in formatted_results], deadline=deadline)
+        for result, embedding in zip(formatted_results, embeddings):
+            result["embedding"] = embedding
+        return formatted_results
 
-    except httpx.HTTPStatusError as e:
-        logging.error(
-            "An HTTP error occurred while searching Semantic Scholar.")
-        logging.error(f"Status code: {e.response.status_code}")
-        logging.error(f"Response body: {e.response.text}")
-        logging.error(f"Response headers: {e.response.headers}")
-        return []
+    except UpstreamError as e:
+        logging.error(f"Semantic Scholar is unavailable: {e}")
+        raise
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logging.error(
             f"An unexpected error occurred while searching Semantic Scholar: {e}")
@@ -1,36 +1,70 @@
-import asyncio
-from langchain_tavily import TavilySearch
-from .embeddings import get_embedding
+import logging
+import os
+from .clients import get_clients
+from .embeddings import get_embeddings
+from .resilience import UpstreamError, get_upstream
+from utils.deadline import DeadlineExceeded, request_timeout
+from utils.metrics import UPSTREAM_REQUESTS
+from utils.retrieval import candidate_pool, select_candidates
 
+logger = logging.getLogger(__name__)
 
-async def get_web_search_results(query: str, max_results=10):
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com")
+# Most results Tavily returns per search.
+MAX_PAGE_SIZE = 20
+
+
+async def get_web_search_results(query: str, max_results=10, client=None, deadline=None):
     """
     Uses Tavily to perform an async web search and embeds the results.
+    Calls the Tavily REST API over the shared pooled client instead of
+    building a new TavilySearch (and HTTP session) per call. Extra candidates
+    are fetched and ranked with BM25; only the best `max_results` are embedded.
     """
-    search = TavilySearch(max_results=max_results)
-    try:
-        # TavilySearch returns a dictionary with a 'results' key
-        response = await search.ainvoke({"query": query})
-        results = response.get("results", [])
+    if client is None:
+        client = get_clients().tavily
 
-        async def format_and_embed(result):
-            # Each result is a dictionary, extract content for embedding
-            text_to_embed = result.get('content', '')
-            if not text_to_embed:
-                return None
+    headers = {
+        "Authorization": f"Bearer {os.getenv('TAVILY_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+    params = {
+        "query": query,
+        "max_results": candidate_pool(MAX_PAGE_SIZE, max_results),
+        "search_depth": "basic",
+        "topic": "general",
+    }
+    try:
+        response = await get_upstream("tavily").request(
+            lambda: client.post(f"{TAVILY_API_URL}/search", json=params, headers=headers,
+                                timeout=request_timeout(deadline)),
+            deadline)
+        # Tavily returns a dictionary with a 'results' key
+        results = response.json().get("results", [])
 
-            embedding = await get_embedding(text_to_embed)
-            return {
+        # Each result is a dictionary, extract content for embedding
+        formatted_results = [
+            {
                 "title": result.get('title', 'No Title'),
                 "snippet": result.get('content', ''),
                 "link": result.get('url', '#'),
-                "embedding": embedding
             }
-
-        # Filter out None results from formatting
-        embedded_results = filter(None, await asyncio.gather(*(format_and_embed(r) for r in results)))
-        return list(embedded_results)
-    except Exception as e:
-        # Handle cases where the search might fail
-        print(f"An error occurred during web search: {e}")
+            for result in results if result.get('content')
+        ]
+        formatted_results = select_candidates(query, formatted_results, max_results)
+        embeddings = await get_embeddings(
+            [r["snippet"] for r in formatted_results], deadline=deadline)
+        for result, embedding in zip(formatted_results, embeddings):
+            result["embedding"] = embedding
+        return formatted_results
+    except UpstreamError as e:
+        logging.error(f"Tavily is unavailable: {e}")
+        raise
+    except DeadlineExceeded:
+        raise
+    except Exception:
+        # The call itself was already counted; also count the failure to
+        # handle its response, so it doesn't pass as an empty result.
+        logger.exception("An error occurred during web search")
+        UPSTREAM_REQUESTS.labels("tavily", "processing_error").inc()
         return []
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+
+# SQLite memory-maps up to this much of each cache database, so worker
+# processes read it through the shared page cache.
+MMAP_BYTES = int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024
+# How long a write waits for another worker's write lock before failing.
+BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "5"))
+
+
+def connect_cache_db(path: str, **pragmas) -> sqlite3.Connection:
+    """
+    Opens a cache database that every worker on the host shares: WAL
+    journaling, memory-mapped reads and a busy timeout, plus any extra `pragmas` (e.g.
+    synchronous="NORMAL"). Creates the parent directory; an empty path
+    opens a private in-memory database.
+    """
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path or ":memory:", timeout=BUSY_TIMEOUT_SECONDS,
+                         check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+    for name, value in pragmas.items():
+        db.execute(f"PRAGMA {name}={value}")
+    return db
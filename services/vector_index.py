@@ -0,0 +1,276 @@
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+_MAGIC = 0x3130584449565344  # b"DSVIDX01" read as a little-endian int64
+_HEADER_BYTES = 64
+_MIN_CAPACITY = 1024
+# Id of a removed row. Row ids are SQLite rowids, which are positive.
+_REMOVED = -1
+
+
+class VectorIndex:
+    """
+    Growable matrix of vectors with an id and a timestamp per row, kept in
+    this process. Appends are amortized O(d).
+    """
+
+    def __init__(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._count = 0
+        self._removed = 0
+
+    @property
+    def count(self) -> int:
+        return self._count - self._removed
+
+    def snapshot(self):
+        """
+        Returns (ids, created, matrix) views of the rows stored so far.
+        """
+        count = self._count
+        return self._ids[:count], self._created[:count], self._matrix[:count]
+
+    def append(self, row_id: int, vector: np.ndarray, created_at: float):
+        if self._matrix.shape[1] != vector.shape[0]:
+            # First entry, or the embedding model changed; only the newest
+            # dimension is searchable.
+            self.rebuild([], [], np.empty((0, vector.shape[0]), dtype=np.float32))
+        if self._count == len(self._ids):
+            # Grow the buffers geometrically so appends are amortized O(d).
+            self._resize(max(16, 2 * self._count))
+        self._matrix[self._count] = vector
+        self._ids[self._count] = row_id
+        self._created[self._count] = created_at
+        self._count += 1
+
+    def rebuild(self, ids, created, matrix):
+        """
+        Replaces every row.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self._matrix = matrix.copy()
+        self._ids = np.array(ids, dtype=np.int64)
+        self._created = np.array(created, dtype=np.float64)
+        self._count = len(self._ids)
+        self._removed = 0
+
+    def remove(self, row_ids):
+        """
+        Drops the rows with these ids. They are blanked in place and the
+        space is reclaimed once blanked rows make up half the index.
+        """
+        removed = _blank(self._ids[:self._count], self._created, self._matrix, row_ids)
+        self._removed += removed
+        if removed and 2 * self._removed > self._count:
+            self.rebuild(*_live_rows(*self.snapshot()))
+
+    def _resize(self, capacity):
+        count = self._count
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[:count] = self._matrix[:count]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:count] = self._ids[:count]
+        created = np.zeros(capacity, dtype=np.float64)
+        created[:count] = self._created[:count]
+        self._matrix, self._ids, self._created = matrix, ids, created
+
+
+class SharedVectorIndex(VectorIndex):
+    """
+    The same index in a memory-mapped file, so every worker process on a
+    host reads one copy through the page cache and sees rows appended by the
+    others. Writers take an exclusive file lock; a row is written before the
+    count in the header is bumped, so readers never see a partial row.
+    Growing or rebuilding writes a new file and renames it into place, and
+    readers remap when the file changes.
+
+    Removed rows are blanked in place and counted in the header; the file
+    is rewritten without them once they make up half of it.
+
+    Layout: a 64-byte header (magic, dimension, capacity, count, removed),
+    then int64 ids, float64 timestamps and the float32 matrix, each sized
+    for the capacity.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = _FileLock(path + ".lock")
+        self._file_id = None
+        self._header = None
+        super().__init__()
+        self._remap()
+
+    @property
+    def count(self) -> int:
+        self._remap()
+        return int(self._header[3] - self._header[4]) if self._header is not None else 0
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def snapshot(self):
+        self._remap()
+        if self._header is None:
+            return super().snapshot()
+        count = int(self._header[3])
+        return self._ids[:count], self._created[:count], self._matrix[:count]
+
+    def append(self, row_id: int, vector: np.ndarray, created_at: float):
+        with self._lock:
+            self._remap()
+            if self._header is None or self._matrix.shape[1] != vector.shape[0]:
+                self._write_file(_MIN_CAPACITY, vector.shape[0])
+            count = int(self._header[3])
+            if np.any(self._ids[:count] == row_id):
+                # A rebuild already read this row from the database.
+                return
+            if count == self._matrix.shape[0]:
+                self._write_file(2 * count, vector.shape[0], *_live_rows(*self.snapshot()))
+                count = int(self._header[3])
+            self._matrix[count] = vector
+            self._ids[count] = row_id
+            self._created[count] = created_at
+            self._header[3] = count + 1
+
+    def rebuild(self, ids, created, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        with self._lock:
+            self._write_file(max(_MIN_CAPACITY, 2 * len(matrix)), matrix.shape[1],
+                             np.asarray(ids, dtype=np.int64),
+                             np.asarray(created, dtype=np.float64), matrix)
+
+    def remove(self, row_ids):
+        with self._lock:
+            self._remap()
+            if self._header is None:
+                return
+            count = int(self._header[3])
+            removed = _blank(self._ids[:count], self._created, self._matrix, row_ids)
+            if not removed:
+                return
+            self._header[4] += removed
+            if 2 * int(self._header[4]) > count:
+                ids, created, matrix = _live_rows(*self.snapshot())
+                self._write_file(self._matrix.shape[0], self._matrix.shape[1],
+                                 ids, created, matrix)
+
+    def locked(self):
+        """
+        Holds the index's file lock, so a caller can read the source rows
+        and rebuild without another process appending in between.
+        """
+        return self._lock
+
+    def _remap(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._file_id = None
+            self._header = None
+            return
+        file_id = (stat.st_ino, stat.st_size)
+        if file_id == self._file_id:
+            return
+        data = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        header = data[:_HEADER_BYTES].view(np.int64)
+        if header[0] != _MAGIC:
+            logging.warning(f"Ignoring {self.path}: not a vector index")
+            self._file_id = None
+            self._header = None
+            return
+        dimension, capacity = int(header[1]), int(header[2])
+        offset = _HEADER_BYTES
+        self._ids = data[offset:offset + 8 * capacity].view(np.int64)
+        offset += 8 * capacity
+        self._created = data[offset:offset + 8 * capacity].view(np.float64)
+        offset += 8 * capacity
+        self._matrix = data[offset:offset + 4 * capacity * dimension].view(
+            np.float32).reshape(capacity, dimension)
+        self._header = header
+        self._file_id = file_id
+
+    def _write_file(self, capacity, dimension, ids=(), created=(), matrix=None):
+        count = len(ids)
+        size = _HEADER_BYTES + capacity * (16 + 4 * dimension)
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".vector-index-")
+        try:
+            os.ftruncate(fd, size)
+            os.close(fd)
+            data = np.memmap(tmp_path, dtype=np.uint8, mode="r+")
+            data[:_HEADER_BYTES].view(np.int64)[:4] = (_MAGIC, dimension, capacity, count)
+            offset = _HEADER_BYTES
+            data[offset:offset + 8 * count].view(np.int64)[:] = ids
+            offset += 8 * capacity
+            data[offset:offset + 8 * count].view(np.float64)[:] = created
+            offset += 8 * capacity
+            if count:
+                data[offset:offset + 4 * count * dimension].view(
+                    np.float32).reshape(count, dimension)[:] = matrix
+            data.flush()
+            del data
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._remap()
+
+
+def _blank(ids, created, matrix, row_ids) -> int:
+    """
+    Blanks the rows of `ids` whose id is in `row_ids`: no id, a timestamp
+    that is always expired and a zero vector, so lookups skip them. Returns
+    how many rows were blanked.
+    """
+    positions = np.flatnonzero(np.isin(ids, np.asarray(row_ids, dtype=np.int64)))
+    # Expire the row before clearing it, for readers in other processes.
+    created[positions] = -np.inf
+    matrix[positions] = 0.0
+    ids[positions] = _REMOVED
+    return len(positions)
+
+
+def _live_rows(ids, created, matrix):
+    live = ids != _REMOVED
+    return ids[live], created[live], matrix[live]
+
+
+class _FileLock:
+    """
+    Exclusive lock shared by the processes on a host (flock) and the threads
+    of this one. Re-entrant within a thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
@@ -0,0 +1,252 @@
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from .sqlite_store import connect_cache_db
+from .vector_index import SharedVectorIndex, VectorIndex
+
+CACHE_PATH = os.getenv("VERDICT_CACHE_PATH", ".cache/verdicts.sqlite3")
+TTL_SECONDS = float(os.getenv("VERDICT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Maximum cosine distance (1 - similarity) between two idea embeddings for
+# them to share a verdict.
+MAX_DISTANCE = float(os.getenv("VERDICT_CACHE_MAX_DISTANCE", "0.05"))
+MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "10000"))
+# Memory-mapped copy of the idea embeddings shared by all worker processes
+# on a host; defaults to a file next to the database.
+INDEX_PATH = os.getenv("VERDICT_CACHE_INDEX_PATH", f"{CACHE_PATH}.index" if CACHE_PATH else "")
+
+
+@dataclass
+class CachedVerdict:
+    verdict: str
+    matches: list
+    similarity: float
+
+
+def normalize_idea(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(normalize_idea(text).encode("utf-8")).hexdigest()
+
+
+def _strip_embeddings(matches: list) -> list:
+    """
+    Drops result embeddings from matches before they are stored; only the
+    display fields are needed to replay a verdict.
+    """
+    stripped = []
+    for match in matches or []:
+        details = {k: v for k, v in (match.get("details") or {}).items()
+                   if k != "embedding"}
+        stripped.append({**match, "details": details})
+    return stripped
+
+
+class VerdictCache:
+    """
+    Stores final verdicts keyed both on the normalized idea text (exact fast
+    path, checked before any LLM call) and on the idea embedding (semantic
+    path, checked once embed_idea has run). Entries expire after a TTL and
+    are persisted in SQLite; the unit-normalized embeddings are also kept in
+    a contiguous float32 matrix so a lookup is one matrix-vector product.
+    With `index_path` the matrix is a memory-mapped file that all workers
+    share, so a verdict stored by one is found by the others.
+
+    The methods block on SQLite, so async code calls them through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL_SECONDS, max_distance=MAX_DISTANCE,
+                 max_entries=MAX_ENTRIES, index_path=INDEX_PATH):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._db = connect_cache_db(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, text_key TEXT UNIQUE NOT NULL, "
+            "embedding BLOB, verdict TEXT NOT NULL, matches TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS verdicts_created_at ON verdicts(created_at)")
+        self._db.commit()
+        # Rows in the table as far as this process knows; rows stored by
+        # other workers are counted when it passes max_entries.
+        self._rows = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if path and index_path:
+            self._index = SharedVectorIndex(index_path)
+            # Another worker may already have built the shared index. The
+            # lock is held from the check through the rebuild, so no other
+            # worker appends a row between the SELECT and the new file.
+            with self._index.locked():
+                if not self._index.exists:
+                    self._load_index()
+        else:
+            self._index = VectorIndex()
+            self._load_index()
+
+    def lookup_exact(self, idea: str):
+        """
+        Returns the cached verdict for an idea with the same normalized text.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT verdict, matches FROM verdicts WHERE text_key = ? AND created_at >= ?",
+                (_text_key(idea), time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return CachedVerdict(verdict=row[0], matches=json.loads(row[1]), similarity=1.0)
+
+    def lookup_similar(self, embedding):
+        """
+        Returns the cached verdict of the closest past idea if it lies within
+        the configured cosine distance of `embedding`.
+        """
+        if embedding is None:
+            return None
+        with self._lock:
+            query = np.asarray(embedding, dtype=np.float32)
+            ids, created, matrix = self._index.snapshot()
+            if len(ids) == 0 or query.shape[0] != matrix.shape[1]:
+                self.misses += 1
+                return None
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                self.misses += 1
+                return None
+
+            scores = matrix @ (query / norm)
+            scores[created < time.time() - self.ttl] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if 1.0 - similarity > self.max_distance:
+                self.misses += 1
+                return None
+
+            row = self._db.execute(
+                "SELECT verdict, matches FROM verdicts WHERE id = ?",
+                (int(ids[best]),),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.semantic_hits += 1
+            return CachedVerdict(verdict=row[0], matches=json.loads(row[1]),
+                                 similarity=similarity)
+
+    def store(self, idea: str, embedding, verdict: str, matches: list):
+        now = time.time()
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+        text_key = _text_key(idea)
+        with self._lock:
+            try:
+                # The entry this one replaces and any that have expired.
+                removed = self._select_ids(
+                    "SELECT id FROM verdicts WHERE text_key = ? OR created_at < ?",
+                    (text_key, now - self.ttl))
+                self._delete(removed)
+                cursor = self._db.execute(
+                    "INSERT INTO verdicts "
+                    "(text_key, embedding, verdict, matches, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        text_key,
+                        vector.tobytes() if vector is not None else None,
+                        verdict,
+                        json.dumps(_strip_embeddings(matches), default=str),
+                        now,
+                    ),
+                )
+                row_id = cursor.lastrowid
+                self._rows += 1 - len(removed)
+                if self._rows > self.max_entries:
+                    self._rows = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+                    oldest = self._select_ids(
+                        "SELECT id FROM verdicts ORDER BY created_at LIMIT ?",
+                        (max(0, self._rows - self.max_entries),))
+                    self._delete(oldest)
+                    self._rows -= len(oldest)
+                    removed += oldest
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                logging.warning(f"Failed to store verdict: {e}")
+                return
+
+            # Only the rows that went away leave the index; nothing is reloaded.
+            if removed:
+                self._index.remove(removed)
+            if vector is not None:
+                self._append(row_id, vector, now)
+
+    def _select_ids(self, query: str, params) -> list:
+        return [row_id for (row_id,) in self._db.execute(query, params)]
+
+    def _delete(self, ids: list):
+        self._db.executemany("DELETE FROM verdicts WHERE id = ?", [(i,) for i in ids])
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "entries": self._index.count,
+        }
+
+    def _load_index(self):
+        rows = self._db.execute(
+            "SELECT id, embedding, created_at FROM verdicts "
+            "WHERE embedding IS NOT NULL AND created_at >= ? ORDER BY id",
+            (time.time() - self.ttl,),
+        ).fetchall()
+        ids, created, vectors = [], [], []
+        for row_id, blob, created_at in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                continue
+            if vectors and vector.shape[0] != vectors[-1].shape[0]:
+                # The embedding model changed; only the newest dimension is
+                # searchable.
+                ids, created, vectors = [], [], []
+            ids.append(row_id)
+            created.append(created_at)
+            vectors.append(vector / norm)
+        dimension = vectors[-1].shape[0] if vectors else 0
+        self._index.rebuild(
+            ids, created, np.array(vectors, dtype=np.float32).reshape(len(vectors), dimension))
+
+    def _append(self, row_id, vector, created_at):
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+        self._index.append(row_id, vector / norm, created_at)
+
+
+_cache = None
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _cache
+    if _cache is None:
+        _cache = VerdictCache()
+    return _cache
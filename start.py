@@ -1,12 +1,72 @@
 import uvicorn
+import logging
 import os
 
+# "development" runs a single uvicorn process. "production" runs a gunicorn
+# master that imports the app and warms it up once, then forks uvicorn
+# workers that share that memory copy-on-write.
+SERVE_MODE = os.environ.get("SERVE_MODE", "development")
+
+
+def worker_count() -> int:
+    """
+    WEB_CONCURRENCY if set, otherwise one worker per CPU available to this
+    process.
+    """
+    configured = os.environ.get("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _mark_process_dead(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def serve_production(host: str, port: int, workers: int):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logging.warning("gunicorn is not installed; starting uvicorn workers without preloading")
+        uvicorn.run("main:app", host=host, port=port, workers=workers)
+        return
+
+    # Each worker keeps a small hot set of embeddings in memory; the rest is
+    # read from the SQLite store, which is memory-mapped and shared.
+    os.environ.setdefault("EMBEDDING_CACHE_MAX_ENTRIES", "1000")
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            # Import the app in the master so workers fork from a warm copy.
+            self.cfg.set("preload_app", True)
+            self.cfg.set("graceful_timeout", 30)
+            if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+                self.cfg.set("child_exit", _mark_process_dead)
+
+        def load(self):
+            import main
+            main.warm_up()
+            return main.app
+
+    Application().run()
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=False,
-        workers=1
-    )
+    if SERVE_MODE == "production":
+        serve_production("0.0.0.0", port, worker_count())
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            reload=False,
+            workers=1
+        )
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+# Total time budget for one check, from the request arriving to the verdict.
+CHECK_DEADLINE_SECONDS = float(os.getenv("CHECK_DEADLINE_SECONDS", "30"))
+# Part of the budget held back for writing the verdict; searches and routing
+# must finish before it starts.
+SUMMARY_RESERVE_SECONDS = float(os.getenv("SUMMARY_RESERVE_SECONDS", "8"))
+# Per-request cap for a single upstream call, as before deadlines existed.
+DEFAULT_REQUEST_TIMEOUT = 20.0
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a check has no time left for a step."""
+
+
+def new_deadline(budget: float = CHECK_DEADLINE_SECONDS) -> Optional[float]:
+    """
+    Returns the monotonic-clock deadline for a check starting now, or None
+    when the budget is disabled (0 or less).
+    """
+    return time.monotonic() + budget if budget > 0 else None
+
+
+def reserve_before(deadline: Optional[float], reserve: float) -> Optional[float]:
+    """
+    Returns an earlier deadline that leaves `reserve` seconds for later steps.
+    """
+    return deadline - reserve if deadline is not None else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """
+    Seconds left until the deadline (negative once it has passed), or None
+    when there is no deadline.
+    """
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def expired(deadline: Optional[float]) -> bool:
+    left = remaining(deadline)
+    return left is not None and left <= 0
+
+
+def request_timeout(deadline: Optional[float], default: float = DEFAULT_REQUEST_TIMEOUT) -> float:
+    """
+    Timeout for one upstream request: the usual cap, shortened to the time
+    left before the deadline.
+    """
+    left = remaining(deadline)
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded()
+    return min(default, left)
+
+
+async def run_with_deadline(awaitable, deadline: Optional[float]):
+    """
+    Awaits `awaitable`, cancelling it and raising DeadlineExceeded if the
+    deadline passes first.
+    """
+    left = remaining(deadline)
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded() from None
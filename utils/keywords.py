@@ -0,0 +1,136 @@
+import os
+import re
+from collections import defaultdict
+
+from utils.retrieval import STOP_WORDS
+
+# Longest idea, in words, that is used as its own summary. Longer ideas are
+# cut down to their best-scoring sentences.
+SUMMARY_MAX_WORDS = int(os.getenv("LOCAL_SUMMARY_MAX_WORDS", "40"))
+MAX_KEYWORDS = 8
+MAX_PHRASE_WORDS = 3
+# A local parse is only used with at least this many keyword phrases and
+# this many distinct content words in the summary.
+MIN_KEYWORDS = 2
+MIN_SUMMARY_TERMS = 3
+
+# Words that end a candidate phrase (RAKE), on top of STOP_WORDS.
+PHRASE_BREAKS = STOP_WORDS | {
+    'about', 'after', 'all', 'also', 'any', 'but', 'can', 'could', 'do', 'does',
+    'each', 'even', 'every', 'have', 'having', 'how', 'if', 'into', 'just',
+    'like', 'make', 'makes', 'me', 'more', 'my', 'no', 'not', 'or', 'our',
+    'out', 'over', 'so', 'some', 'such', 'than', 'then', 'there', 'these',
+    'they', 'this', 'those', 'through', 'thing', 'uses', 'very', 'via', 'we',
+    'what', 'when', 'where', 'which', 'while', 'who', 'why', 'would', 'you',
+    'your', 'idea', 'invention', 'allows', 'lets', 'help', 'helps', 'keep',
+    'keeps', 'include', 'includes', 'including', 'contains', 'provides', 'use',
+    'used', 'get', 'gets',
+}
+
+_WORD = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_FRAGMENT_BREAK = re.compile(r"[.,;:!?()\[\]{}\"\n]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Lead-ins that carry no content, e.g. "I have an idea for ...".
+_PREAMBLE = re.compile(
+    r"^\s*(?:(?:so|ok|okay|hi|hello)[,!.\s]+)*"
+    r"(?:(?:i have|i've got|here is|here's) an? (?:idea|invention)(?: for| about)?|"
+    r"my (?:idea|invention) is(?: for| about)?|an? (?:idea|invention) (?:for|about)|"
+    r"i (?:want|would like|plan) to (?:build|make|create|invent)|"
+    r"what if (?:there was|there were|we had|you had)|imagine)[\s:,-]*",
+    re.IGNORECASE,
+)
+
+
+def _phrases(text: str) -> list:
+    """
+    Candidate phrases: runs of content words between punctuation and
+    PHRASE_BREAKS words, split into pieces of at most MAX_PHRASE_WORDS.
+    """
+    phrases = []
+    for fragment in _FRAGMENT_BREAK.split(text.lower()):
+        run = []
+        for word in _WORD.findall(fragment) + [None]:
+            if word is not None and word not in PHRASE_BREAKS and len(word) > 1 \
+                    and not word.isdigit():
+                run.append(word)
+                continue
+            for start in range(0, len(run), MAX_PHRASE_WORDS):
+                phrases.append(tuple(run[start:start + MAX_PHRASE_WORDS]))
+            run = []
+    return phrases
+
+
+def word_scores(phrases: list) -> dict:
+    """
+    RAKE word scores: a word's degree (the length of the phrases it appears
+    in, summed) over its frequency, so words in longer phrases rank higher.
+    """
+    frequency = defaultdict(int)
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+    return {word: degree[word] / frequency[word] for word in frequency}
+
+
+def extract_keywords(text: str, max_keywords: int = MAX_KEYWORDS) -> list:
+    """
+    Returns up to `max_keywords` key phrases of `text`, best first, scored
+    RAKE-style as the sum of their word scores. Ties keep text order.
+    """
+    phrases = _phrases(text or "")
+    scores = word_scores(phrases)
+    unique = list(dict.fromkeys(phrases))
+    ranked = sorted(unique, key=lambda phrase: -sum(scores[w] for w in phrase))
+    return [" ".join(phrase) for phrase in ranked[:max_keywords]]
+
+
+def strip_preamble(text: str) -> str:
+    """
+    Collapses whitespace and drops a lead-in such as "I have an idea for".
+    """
+    text = _PREAMBLE.sub("", " ".join((text or "").split()))
+    return text[:1].upper() + text[1:]
+
+
+def summarize(text: str, max_words: int = SUMMARY_MAX_WORDS) -> str:
+    """
+    Extractive summary: the whole text if it fits in `max_words`, otherwise
+    the first sentence (which usually names the invention) and then the
+    highest-scoring sentences that fit, in their original order. Returns ""
+    when not even one sentence fits.
+    """
+    if len(text.split()) <= max_words:
+        return text
+
+    sentences = _SENTENCE_END.split(text)
+    scores = word_scores(_phrases(text))
+    ranked = [0] + sorted(
+        range(1, len(sentences)),
+        key=lambda i: -sum(scores.get(w, 0) for w in set(_WORD.findall(sentences[i].lower()))))
+    chosen = []
+    words = 0
+    for i in ranked:
+        length = len(sentences[i].split())
+        if words + length <= max_words:
+            chosen.append(i)
+            words += length
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def parse_locally(idea: str):
+    """
+    Summary and keywords of an idea without a model call, in the shape of
+    the LLM parse plus `"parser": "local"`; the keywords are ranked best
+    first. Returns None when the result is too thin to search with
+    (too few keywords, or no summary that fits), so the caller can fall
+    back to the LLM.
+    """
+    idea = strip_preamble(idea)
+    summary = summarize(idea)
+    keywords = extract_keywords(idea)
+    terms = {w for w in _WORD.findall(summary.lower()) if w not in PHRASE_BREAKS}
+    if len(keywords) < MIN_KEYWORDS or len(terms) < MIN_SUMMARY_TERMS:
+        return None
+    return {"summary": summary, "keywords": keywords, "parser": "local"}
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import os
+import time
+
+LOOP_LAG_DEBUG = os.getenv("LOOP_LAG_DEBUG", "0") == "1"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+logger = logging.getLogger("loop_monitor")
+
+
+class LoopLagMonitor:
+    """
+    Debug aid that catches code blocking the event loop. It turns on
+    asyncio's debug mode, which logs every callback running longer than the
+    threshold together with the offending handle, and runs a heartbeat task
+    that logs how late it was woken up whenever the lag exceeds the threshold.
+    """
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval=0.25):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.threshold
+        self._task = loop.create_task(self._heartbeat())
+        logger.warning(
+            f"Event loop lag monitor enabled (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
@@ -0,0 +1,235 @@
+from contextlib import contextmanager
+import asyncio
+import os
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    REGISTRY,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HTTP_REQUESTS = Counter(
+    "doesitexist_http_requests_total", "HTTP requests handled.",
+    ["method", "path", "status"])
+HTTP_LATENCY = Histogram(
+    "doesitexist_http_request_duration_seconds", "HTTP request latency.",
+    ["method", "path"], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge(
+    "doesitexist_http_requests_in_flight", "HTTP requests being handled.",
+    ["path"], multiprocess_mode="livesum")
+
+NODE_LATENCY = Histogram(
+    "doesitexist_graph_node_duration_seconds", "Graph node latency.",
+    ["node"], buckets=LATENCY_BUCKETS)
+NODE_ERRORS = Counter(
+    "doesitexist_graph_node_errors_total", "Graph node failures.", ["node"])
+
+TOOL_LATENCY = Histogram(
+    "doesitexist_tool_duration_seconds", "Tool latency.",
+    ["tool"], buckets=LATENCY_BUCKETS)
+TOOL_ERRORS = Counter(
+    "doesitexist_tool_errors_total", "Tool failures.", ["tool"])
+
+UPSTREAM_LATENCY = Histogram(
+    "doesitexist_upstream_request_duration_seconds", "Upstream API call latency.",
+    ["upstream"], buckets=LATENCY_BUCKETS)
+UPSTREAM_REQUESTS = Counter(
+    "doesitexist_upstream_requests_total", "Upstream API calls by outcome.",
+    ["upstream", "outcome"])
+UPSTREAM_IN_FLIGHT = Gauge(
+    "doesitexist_upstream_requests_in_flight", "Upstream API calls in progress.",
+    ["upstream"], multiprocess_mode="livesum")
+
+UPSTREAM_RETRIES = Counter(
+    "doesitexist_upstream_retries_total", "Upstream calls retried after a 429, 5xx or network error.",
+    ["upstream"])
+UPSTREAM_REJECTED = Counter(
+    "doesitexist_upstream_rejected_total", "Upstream calls failed fast without being sent.",
+    ["upstream", "reason"])
+UPSTREAM_CIRCUIT_OPEN = Gauge(
+    "doesitexist_upstream_circuit_open", "1 while the upstream's circuit breaker is open.",
+    ["upstream"], multiprocess_mode="max")
+UPSTREAM_RATE = Gauge(
+    "doesitexist_upstream_rate_per_second", "Current client-side request rate allowed per upstream.",
+    ["upstream"], multiprocess_mode="livesum")
+
+PATENT_STRATEGY_CALLS = Counter(
+    "doesitexist_patent_strategy_calls_total",
+    "PatentsView query strategies by outcome (win, superseded, empty, error, cancelled).",
+    ["strategy", "outcome"])
+PATENT_STRATEGY_LATENCY = Histogram(
+    "doesitexist_patent_strategy_duration_seconds", "PatentsView query strategy latency.",
+    ["strategy", "outcome"], buckets=LATENCY_BUCKETS)
+
+EMBEDDING_FAILURES = Counter(
+    "doesitexist_embedding_failures_total",
+    "Texts left without an embedding because their embeddings request failed.", ["model"])
+
+LLM_TOKENS = Counter(
+    "doesitexist_llm_tokens_total", "LLM tokens used.", ["model", "type"])
+
+IDEA_PARSES = Counter(
+    "doesitexist_idea_parses_total", "Ideas parsed, by how the summary was made.", ["parser"])
+
+
+@contextmanager
+def _observe(latency, errors, label):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.labels(label).inc()
+        raise
+    finally:
+        latency.labels(label).observe(time.perf_counter() - started)
+
+
+def observe_node(node: str):
+    return _observe(NODE_LATENCY, NODE_ERRORS, node)
+
+
+def observe_tool(tool: str):
+    return _observe(TOOL_LATENCY, TOOL_ERRORS, tool)
+
+
+class UpstreamCall:
+    """
+    Handle yielded by `observe_upstream`; set `outcome` to override the
+    default ok/error classification (e.g. "rate_limited").
+    """
+    outcome = None
+
+
+@contextmanager
+def observe_upstream(upstream: str):
+    """
+    Times one upstream API call and counts it as ok, error or cancelled.
+    """
+    UPSTREAM_IN_FLIGHT.labels(upstream).inc()
+    started = time.perf_counter()
+    call = UpstreamCall()
+    outcome = "error"
+    try:
+        yield call
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(upstream).observe(time.perf_counter() - started)
+        UPSTREAM_REQUESTS.labels(upstream, call.outcome or outcome).inc()
+        UPSTREAM_IN_FLIGHT.labels(upstream).dec()
+
+
+def timed_node(name: str, node):
+    """
+    Wraps an async graph node so its latency and failures are recorded.
+    """
+    async def wrapper(state):
+        with observe_node(name):
+            return await node(state)
+    wrapper.__name__ = getattr(node, "__name__", name)
+    return wrapper
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records OpenAI chat latency, failures and token
+    usage for every chat model call it is attached to.
+    """
+
+    def __init__(self):
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        self._started[run_id] = (time.perf_counter(), model)
+        UPSTREAM_IN_FLIGHT.labels("openai_chat").inc()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model = self._finish(run_id, "ok")
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            # Streamed responses report usage on the message instead.
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if metadata:
+                        prompt_tokens = (prompt_tokens or 0) + metadata.get("input_tokens", 0)
+                        completion_tokens = (completion_tokens or 0) + metadata.get("output_tokens", 0)
+        if prompt_tokens:
+            LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id, outcome):
+        started, model = self._started.pop(run_id, (None, "unknown"))
+        if started is None:
+            return model
+        UPSTREAM_IN_FLIGHT.labels("openai_chat").dec()
+        UPSTREAM_LATENCY.labels("openai_chat").observe(time.perf_counter() - started)
+        UPSTREAM_REQUESTS.labels("openai_chat", outcome).inc()
+        return model
+
+
+LLM_METRICS_HANDLER = LLMMetricsHandler()
+
+
+class CacheStatsCollector:
+    """
+    Exposes the hit, miss and eviction counters the caches already keep.
+    Caches are registered by module and read from its `_cache` singleton, so
+    a scrape only reports the caches in use and never builds one.
+    """
+
+    def __init__(self):
+        self._modules = {}
+
+    def register(self, name: str, module):
+        self._modules[name] = module
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "doesitexist_cache_stat", "Cache counters and sizes.", labels=["cache", "stat"])
+        for name, module in self._modules.items():
+            cache = getattr(module, "_cache", None)
+            if cache is None:
+                continue
+            for stat, value in cache.stats().items():
+                family.add_metric([name, stat], value)
+        yield family
+
+
+CACHE_STATS = CacheStatsCollector()
+REGISTRY.register(CACHE_STATS)
+
+
+def render_metrics():
+    """
+    Returns the Prometheus exposition body and content type. When
+    PROMETHEUS_MULTIPROC_DIR is set, metrics from every worker process are
+    aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(CACHE_STATS)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
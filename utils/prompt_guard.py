@@ -0,0 +1,192 @@
+from collections import deque
+import json
+import os
+from pathlib import Path
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+RULES_PATH = os.getenv(
+    "PROMPT_RULES_PATH", str(Path(__file__).parent / "prompt_rules.json"))
+
+
+class _PyAutomaton:
+    """
+    Minimal pure-Python Aho-Corasick automaton, used when the `pyahocorasick`
+    C extension is not installed. `iter(text)` yields `(end_index, word)` for
+    every occurrence of every word, like `ahocorasick.Automaton.iter`.
+    """
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word in words:
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state] = self._out[state] + (word,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in out[state]:
+                yield i, word
+
+
+def _build_automaton(words):
+    if ahocorasick is None:
+        return _PyAutomaton(words)
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+
+class PromptGuard:
+    """
+    Compiled prompt-injection screen. Every literal used by any rule goes into
+    one Aho-Corasick automaton, so the lowercased text is scanned once; the
+    literal patterns, co-occurrence rules, HTML-comment rule and JSON-value
+    rule are then evaluated against the set of hits.
+    """
+
+    def __init__(self, rules: dict):
+        self.patterns = frozenset(rules.get("patterns", []))
+        self.co_occurrence = [
+            (rule["name"], [frozenset(group) for group in rule["all"]])
+            for rule in rules.get("co_occurrence", [])
+        ]
+        comment = rules.get("html_comment") or {}
+        self.comment_open = comment.get("open")
+        self.comment_close = comment.get("close")
+        self.comment_terms = frozenset(comment.get("terms", []))
+        self.json_values = tuple(rules.get("json_values", []))
+
+        words = set(self.patterns) | self.comment_terms | set(self.json_values)
+        for _, groups in self.co_occurrence:
+            for group in groups:
+                words |= group
+        # Words whose positions (not just presence) the HTML-comment rule needs.
+        self._positional = set(self.comment_terms)
+        if self.comment_open and self.comment_close:
+            self._positional |= {self.comment_open, self.comment_close}
+            words |= {self.comment_open, self.comment_close}
+        self._automaton = _build_automaton(sorted(words))
+
+    @classmethod
+    def from_file(cls, path=RULES_PATH) -> "PromptGuard":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def is_high_risk(self, text: str) -> bool:
+        return self.first_match(text) is not None
+
+    def first_match(self, text: str):
+        """
+        Returns the name of a rule the text trips, or None.
+        """
+        lowered = text.lower()
+        found = set()
+        positions = []
+        positional = self._positional
+        for end, word in self._automaton.iter(lowered):
+            found.add(word)
+            if word in positional:
+                positions.append((end - len(word) + 1, end + 1, word))
+
+        if found:
+            hit = found & self.patterns
+            if hit:
+                return f"pattern:{min(hit)}"
+            for name, groups in self.co_occurrence:
+                if all(not group.isdisjoint(found) for group in groups):
+                    return name
+            if self.comment_open in found and self._has_malicious_comment(positions):
+                return "html_comment"
+        if self._has_malicious_json(text, found):
+            return "json_values"
+        return None
+
+    def _has_malicious_comment(self, positions):
+        # Mirrors re.findall(r"<!--(.*?)-->", DOTALL): each comment runs from
+        # an opener to the first closer after it, and scanning resumes after
+        # that closer.
+        opener = None
+        terms = []
+        resume = 0
+        for start, end, word in sorted(positions):
+            if start < resume:
+                continue
+            if opener is None:
+                if word == self.comment_open:
+                    opener = end
+                    terms = []
+            elif word == self.comment_close and start >= opener:
+                if any(s >= opener and e <= start for s, e in terms):
+                    return True
+                opener = None
+                resume = end
+            elif word in self.comment_terms:
+                terms.append((start, end))
+        return False
+
+    def _has_malicious_json(self, text, found):
+        # Only parse when the input looks like a JSON object and one of the
+        # JSON triggers appears in it (or could be hidden behind an escape).
+        if not text.lstrip().startswith("{"):
+            return False
+        if "\\" not in text and not any(trigger in found for trigger in self.json_values):
+            return False
+        try:
+            parsed = json.loads(text)
+        except Exception:
+            return False
+        if not isinstance(parsed, dict):
+            return False
+        for value in parsed.values():
+            if isinstance(value, str):
+                lowered_val = value.lower()
+                if any(trigger in lowered_val for trigger in self.json_values):
+                    return True
+        return False
+
+
+_guard = None
+
+
+def get_prompt_guard() -> PromptGuard:
+    global _guard
+    if _guard is None:
+        _guard = PromptGuard.from_file()
+    return _guard
+
+
+def is_high_risk_prompt(text: str) -> bool:
+    return get_prompt_guard().is_high_risk(text)
@@ -0,0 +1,101 @@
+from collections import Counter
+import os
+import re
+
+import numpy as np
+
+# Candidates requested from each source before lexical ranking (capped at
+# what each API allows). Only the best-ranked few are embedded.
+CANDIDATE_POOL_SIZE = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+
+# BM25 parameters. Title terms count TITLE_WEIGHT times, a simplified BM25F.
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+
+# Common stop words and generic terms dropped from queries and documents.
+STOP_WORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+              'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the',
+              'to', 'was', 'will', 'with', 'using', 'device', 'system', 'method'}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased word tokens of `text`, without stop words and single
+    characters.
+    """
+    return [t for t in _TOKEN.findall((text or "").lower())
+            if len(t) > 1 and t not in STOP_WORDS]
+
+
+def candidate_pool(limit: int, num_results: int) -> int:
+    """
+    Number of candidates to request from a source that returns at most
+    `limit` per call, never fewer than the results wanted.
+    """
+    return min(limit, max(num_results, CANDIDATE_POOL_SIZE))
+
+
+def bm25_scores(query: str, documents: list) -> np.ndarray:
+    """
+    Scores (title, body) documents against `query` with BM25, treating the
+    batch as the corpus. Term frequencies for the query terms are gathered
+    into one matrix and scored with array operations.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not documents or not terms:
+        return np.zeros(len(documents), dtype=np.float32)
+
+    rows = []
+    lengths = np.empty(len(documents), dtype=np.float32)
+    for i, (title, body) in enumerate(documents):
+        # Only query terms need counting; document length covers every token.
+        title_tokens = _TOKEN.findall((title or "").lower())
+        body_tokens = _TOKEN.findall((body or "").lower())
+        title_counts = Counter(title_tokens)
+        body_counts = Counter(body_tokens)
+        rows.append([TITLE_WEIGHT * title_counts[t] + body_counts[t] for t in terms])
+        lengths[i] = TITLE_WEIGHT * len(title_tokens) + len(body_tokens)
+    tf = np.array(rows, dtype=np.float32)
+
+    n = len(documents)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+    return (tf * (BM25_K1 + 1) / (tf + norm[:, None])) @ idf.astype(np.float32)
+
+
+def _dedupe_key(title: str) -> str:
+    return " ".join(_TOKEN.findall((title or "").lower()))
+
+
+def select_candidates(query: str, candidates: list, top_k: int) -> list:
+    """
+    Drops duplicate candidates (same link or same normalized title) and
+    returns the `top_k` best by BM25 over title and snippet. Ties keep the
+    source's own order. Candidates are dicts with "title", "snippet" and
+    optionally "link".
+    """
+    seen = set()
+    unique = []
+    for candidate in candidates:
+        keys = set()
+        title = _dedupe_key(candidate.get("title"))
+        # Services fill in "No Title" for untitled results; those aren't duplicates.
+        if title and title != "no title":
+            keys.add(("title", title))
+        if candidate.get("link"):
+            keys.add(("link", candidate["link"].rstrip("/")))
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(candidate)
+
+    if len(unique) <= top_k:
+        order = range(len(unique))
+    else:
+        scores = bm25_scores(query, [(c.get("title"), c.get("snippet")) for c in unique])
+        order = np.argsort(-scores, kind="stable")[:top_k]
+    return [unique[i] for i in order]
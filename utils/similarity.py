@@ -1,5 +1,4 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 
 def calculate_cosine_similarity(vec1, vec2):
@@ -9,8 +8,42 @@ def calculate_cosine_similarity(vec1, vec2):
     if vec1 is None or vec2 is None:
         return 0.0
 
-    # Ensure vectors are numpy arrays and reshaped for sklearn
-    vec1 = np.array(vec1).reshape(1, -1)
-    vec2 = np.array(vec2).reshape(1, -1)
+    vec1, vec2 = normalize_rows(np.stack([
+        np.asarray(vec1, dtype=np.float32).ravel(),
+        np.asarray(vec2, dtype=np.float32).ravel(),
+    ]))
+    return float(vec1 @ vec2)
 
-    return cosine_similarity(vec1, vec2)[0][0]
+
+def normalize_rows(matrix):
+    """
+    Returns a float32 copy of `matrix` with every row scaled to unit length.
+    Zero rows stay zero.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def rank_by_similarity(query, candidates, threshold=None, top_k=None):
+    """
+    Scores every candidate vector (float32 or int8 embeddings) against
+    `query` with a single matrix-vector product. Returns `(indices, scores)` sorted by descending
+    similarity, keeping only scores above `threshold` and at most `top_k`.
+    """
+    if query is None or len(candidates) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+    query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+    scores = normalize_rows(np.stack(candidates)) @ query
+
+    indices = np.arange(len(scores))
+    if threshold is not None:
+        indices = indices[scores > threshold]
+    if top_k is not None and len(indices) > top_k:
+        # argpartition selects the top-k in linear time before the final sort.
+        keep = np.argpartition(scores[indices], -top_k)[-top_k:]
+        indices = indices[keep]
+    indices = indices[np.argsort(-scores[indices], kind="stable")]
+    return indices, scores[indices]